@@ -0,0 +1,29 @@
+"""局域网扫描工具
+
+from iputil import Scanner 时才导入对应的模块（asyncio等），只导入包本身没有额外开销
+    targets   扫描目标解析、地址序列、邻居表
+    probes    存活探测与端口探测（banners: 横幅抓取，pacing: 自适应超时与限速，stats: 扫描统计）
+    resolver  反向DNS解析与缓存
+    sinks     增量结果写入（state: 差异扫描状态库）
+    engine    异步扫描引擎与Scanner
+    monitor   持续监控
+    shards    多进程分片扫描
+    util      命令行入口与scan_network
+"""
+
+_EXPORTS = {
+    "Scanner": "engine",
+    "HostMonitor": "monitor",
+    "scan_network": "util",
+    "monitor_network": "monitor",
+    "scan_port": "probes",
+    "setup_logging": "log",
+}
+
+__all__ = list(_EXPORTS)
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        from importlib import import_module
+        return getattr(import_module(f".{_EXPORTS[name]}", __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
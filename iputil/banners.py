@@ -0,0 +1,63 @@
+"""服务横幅抓取：复用端口探测建立的连接，按端口发送协议握手并把响应压缩成一行文本"""
+import struct
+import asyncio
+
+def smb_negotiate_request():
+    """SMB1 Negotiate请求，同时声明SMB2方言；支持SMB2的服务器会直接回复SMB2 Negotiate响应"""
+    dialects = b"".join(b"\x02" + name + b"\x00" for name in (b"NT LM 0.12", b"SMB 2.002", b"SMB 2.???"))
+    header = (b"\xffSMB" + bytes([0x72]) + b"\x00" * 4 + b"\x18" + struct.pack("<H", 0xc853) + b"\x00" * 14 +
+              struct.pack("<H", 0xfeff) + b"\x00" * 4)
+    message = header + b"\x00" + struct.pack("<H", len(dialects)) + dialects
+    return struct.pack(">I", len(message)) + message
+
+# 连接建立后先发送的协议握手，服务端不会主动发送数据的协议需要它才能得到响应
+BANNER_HELLOS = {
+    "http": b"HEAD / HTTP/1.0\r\n\r\n",
+    "ssh": b"SSH-2.0-iputil\r\n",
+    "smb": smb_negotiate_request(),
+}
+BANNER_PORTS = {
+    80: "http", 8000: "http", 8008: "http", 8080: "http", 8081: "http", 8888: "http",
+    22: "ssh", 2222: "ssh",
+    445: "smb",
+}
+
+class BannerGrabber:
+    """服务横幅抓取：复用端口探测刚建立的连接，按端口发送协议握手后读取最多max_bytes字节
+    读取有独立的短超时，不影响连接阶段的RTT估计和超时判断；未知端口只被动等待服务端先发送数据
+    """
+
+    def __init__(self, timeout=0.5, max_bytes=512, hellos=True):
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.hellos = hellos
+
+    def hello(self, port):
+        return BANNER_HELLOS.get(BANNER_PORTS.get(port)) if self.hellos else None
+
+    async def grab(self, reader, writer, port):
+        """在已建立的异步连接上抓取横幅，超时或出错返回None"""
+        hello = self.hello(port)
+        try:
+            if hello:
+                writer.write(hello)
+                await writer.drain()
+            data = await asyncio.wait_for(reader.read(self.max_bytes), self.timeout)
+        except (asyncio.TimeoutError, OSError):
+            return None
+        return self.summarize(data) if data else None
+
+    @staticmethod
+    def summarize(data):
+        """把响应压缩成一行可读文本：SMB给出协议版本，HTTP给出状态行和Server头，其余取第一行"""
+        if data[4:8] == b"\xfeSMB" and len(data) >= 74:
+            return f"SMB2 dialect 0x{struct.unpack_from('<H', data, 72)[0]:04x}"
+        if data[4:8] == b"\xffSMB":
+            return "SMB1"
+        lines = [line.strip() for line in data.decode("utf-8", "replace").splitlines() if line.strip()]
+        if not lines:
+            return None
+        if lines[0].startswith("HTTP/"):
+            server = next((line for line in lines[1:] if line.lower().startswith("server:")), None)
+            return f"{lines[0]} | {server}" if server else lines[0]
+        return "".join(ch if ch.isprintable() else "." for ch in lines[0])
@@ -0,0 +1,250 @@
+"""iputil扫描吞吐基准测试
+
+在127.0.0.0/8的多个地址上启动监听端口（开放）、不监听的端口（关闭，内核回RST）
+和接收队列已满的"黑洞"端口（SYN被丢弃，永远不响应），
+分别以不同并发度运行scan_port和async_scan_network，输出hosts/s、probes/s和p50/p99延迟。
+结果保存为JSON，可用 --compare 与另一次提交的结果对比。
+
+运行: python -m iputil.bench 或 python iputil/bench.py
+注意：Linux下整个127.0.0.0/8都可直接绑定；macOS需要先为额外的回环地址添加别名。
+"""
+import os
+import sys
+import time
+import json
+import socket
+import asyncio
+import logging
+import argparse
+import platform
+import selectors
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+if not __package__:
+    # 以 python bench.py 直接运行时，把上级目录加入路径，和 python -m iputil.bench 一样按包导入
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from iputil import util
+
+class LoopbackTargets:
+    """在回环地址上布置开放、关闭和黑洞端口"""
+
+    def __init__(self, hosts=32, open_ports=8, closed_ports=4, blackhole_ports=2, base_port=20000,
+                 first_host="127.0.1.1"):
+        first = int.from_bytes(socket.inet_aton(first_host), "big")
+        self.ips = [util.int_to_ip(first + i) for i in range(hosts)]
+        self.open_ports = [base_port + i for i in range(open_ports)]
+        self.closed_ports = [base_port + open_ports + i for i in range(closed_ports)]
+        self.blackhole_ports = [base_port + open_ports + closed_ports + i for i in range(blackhole_ports)]
+        self.listeners = []
+        self.fillers = []
+        self.selector = selectors.DefaultSelector()
+        self.running = False
+        self.thread = None
+
+    @property
+    def ports(self):
+        return self.open_ports + self.closed_ports + self.blackhole_ports
+
+    def start(self):
+        for ip in self.ips:
+            for port in self.open_ports:
+                s = self._listen(ip, port, 1024)
+                s.setblocking(False)
+                self.selector.register(s, selectors.EVENT_READ)
+            for port in self.blackhole_ports:
+                self._fill_backlog(self._listen(ip, port, 0), ip, port)
+        self.running = True
+        self.thread = threading.Thread(target=self._accept_loop, name="bench-acceptor", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join()
+        for s in self.listeners + self.fillers:
+            s.close()
+        self.selector.close()
+
+    def _listen(self, ip, port, backlog):
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        s.bind((ip, port))
+        s.listen(backlog)
+        self.listeners.append(s)
+        return s
+
+    def _fill_backlog(self, listener, ip, port, limit=16):
+        """不断连接一个从不accept的监听套接字，直到接收队列满、新的SYN被内核丢弃"""
+        for _ in range(limit):
+            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            s.settimeout(0.2)
+            try:
+                s.connect((ip, port))
+            except (socket.timeout, OSError):
+                s.close()
+                return
+            self.fillers.append(s)
+        raise RuntimeError(f"无法填满{ip}:{port}的接收队列，黑洞端口不可用")
+
+    def _accept_loop(self):
+        while self.running:
+            for key, _ in self.selector.select(0.1):
+                try:
+                    conn, _ = key.fileobj.accept()
+                    conn.close()
+                except BlockingIOError:
+                    pass
+
+def summarize(name, concurrency, hosts, stats, elapsed, host_latencies=None):
+    """汇总一次基准测试的结果"""
+    connect = stats.histograms["connect"]
+    result = {
+        "bench": name,
+        "concurrency": concurrency,
+        "hosts": hosts,
+        "probes": stats.counters["probes"],
+        "timeouts": stats.counters["timeouts"],
+        "elapsed_s": round(elapsed, 4),
+        "hosts_per_s": round(hosts / elapsed, 1),
+        "probes_per_s": round(stats.counters["probes"] / elapsed, 1),
+        "connect_p50_ms": connect.percentile(50),
+        "connect_p99_ms": connect.percentile(99),
+    }
+    if host_latencies:
+        host_latencies.sort()
+        result["host_p50_ms"] = round(host_latencies[len(host_latencies) // 2] * 1000, 3)
+        result["host_p99_ms"] = round(host_latencies[min(len(host_latencies) - 1,
+                                                         int(len(host_latencies) * 0.99))] * 1000, 3)
+    return result
+
+def bench_scan_port(targets, concurrency, timeout, retries):
+    """用线程池以concurrency台主机并行调用scan_port
+    ScanStats的计数不加锁，每个线程各用一份，结束后合并
+    """
+    local = threading.local()
+    thread_stats = []
+    latencies = []
+
+    def scan(ip):
+        if not hasattr(local, "stats"):
+            local.stats = util.ScanStats()
+            thread_stats.append(local.stats)
+        start = time.monotonic()
+        util.scan_port(ip, targets.ports, timeout=timeout, retries=retries, stats=local.stats)
+        latencies.append(time.monotonic() - start)
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(scan, targets.ips))
+    elapsed = time.monotonic() - start
+    stats = util.ScanStats()
+    for part in thread_stats:
+        stats.merge(part.snapshot())
+    return summarize("scan_port", concurrency, len(targets.ips), stats, elapsed, latencies)
+
+def bench_scan_network(targets, concurrency, timeout, retries):
+    """运行异步扫描引擎；DNS缓存预先填好，测的只是探测本身"""
+    stats = util.ScanStats()
+    resolver = util.HostnameResolver()
+    for ip in targets.ips:
+        resolver.put(ip, "bench")
+
+    async def run():
+        await util.async_scan_network(
+            targets.ips, ports=targets.ports, concurrency=concurrency, timeout=timeout, retries=retries,
+            method="tcp", on_result=lambda device: None, resolver=resolver, stats=stats,
+            show_progress=False, stats_interval=0
+        )
+
+    start = time.monotonic()
+    try:
+        asyncio.run(run())
+    finally:
+        resolver.close()
+    return summarize("scan_network", concurrency, len(targets.ips), stats, time.monotonic() - start)
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(old_file, report):
+    """按(bench, concurrency)对比两次报告的吞吐"""
+    with open(old_file, encoding="utf-8") as f:
+        old = {(r["bench"], r["concurrency"]): r for r in json.load(f)["results"]}
+    print(f"\n与 {old_file} 对比:")
+    for result in report["results"]:
+        before = old.get((result["bench"], result["concurrency"]))
+        if not before:
+            continue
+        for metric in ("hosts_per_s", "probes_per_s"):
+            delta = (result[metric] - before[metric]) / before[metric] * 100 if before[metric] else 0
+            print(f"{result['bench']:<13} c={result['concurrency']:<5} {metric:<13} "
+                  f"{before[metric]:>10} -> {result[metric]:>10} ({delta:+.1f}%)")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="iputil回环扫描基准测试")
+    parser.add_argument("--hosts", type=int, default=32, help="回环地址数量")
+    parser.add_argument("--open-ports", type=int, default=8, help="每个地址的开放端口数")
+    parser.add_argument("--closed-ports", type=int, default=4, help="每个地址的关闭端口数")
+    parser.add_argument("--blackhole-ports", type=int, default=2, help="每个地址的黑洞端口数")
+    parser.add_argument("--base-port", type=int, default=20000, help="起始端口")
+    parser.add_argument("-c", "--concurrency", default="1,8,32,128", help="要测试的并发度，逗号分隔")
+    parser.add_argument("-t", "--timeout", type=float, default=0.2, help="探测超时时间（秒）")
+    parser.add_argument("--retries", type=int, default=1, help="超时重试次数")
+    parser.add_argument("--bench", choices=["all", "scan_port", "scan_network"], default="all")
+    parser.add_argument("-o", "--output", help="JSON报告路径，默认 bench_<提交>.json")
+    parser.add_argument("--compare", help="与之前的JSON报告对比")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    util.logger.setLevel(logging.WARNING)
+    util.raise_nofile_limit()
+    targets = LoopbackTargets(args.hosts, args.open_ports, args.closed_ports, args.blackhole_ports,
+                              args.base_port).start()
+    print(f"已在{len(targets.ips)}个回环地址上布置端口: 开放{len(targets.open_ports)} "
+          f"关闭{len(targets.closed_ports)} 黑洞{len(targets.blackhole_ports)}")
+
+    benches = []
+    if args.bench in ("all", "scan_port"):
+        benches.append(bench_scan_port)
+    if args.bench in ("all", "scan_network"):
+        benches.append(bench_scan_network)
+    results = []
+    try:
+        for bench in benches:
+            for concurrency in [int(c) for c in args.concurrency.split(",") if c]:
+                result = bench(targets, concurrency, args.timeout, args.retries)
+                results.append(result)
+                print(f"{result['bench']:<13} c={concurrency:<5} {result['hosts_per_s']:>9} hosts/s "
+                      f"{result['probes_per_s']:>10} probes/s  connect p50 {result['connect_p50_ms']}ms "
+                      f"p99 {result['connect_p99_ms']}ms  超时 {result['timeouts']}")
+    finally:
+        targets.stop()
+
+    commit = git_commit()
+    report = {
+        "commit": commit,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "params": vars(args),
+        "results": results,
+    }
+    output = args.output or f"bench_{commit or 'local'}.json"
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"报告已保存到: {output}")
+    if args.compare:
+        compare(args.compare, report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""异步扫描引擎与可嵌入的Scanner"""
+import time
+import asyncio
+import logging
+
+from .targets import parse_targets, count_hosts, iter_addresses, rescan_addresses, read_neighbors, neighbor_hosts
+from .pacing import TimeoutPolicy, ProbePacer
+from .stats import ScanStats, report_stats
+from .probes import open_pinger, probe_alive, async_scan_port, raise_nofile_limit
+from .resolver import HostnameResolver
+
+logger = logging.getLogger(__name__)
+
+async def async_scan_network(ips, ports=[445], concurrency=256, timeout=1, method="auto", total=None, retries=2,
+                             on_result=None, resolver=None, policy=None, on_dead=None, show_progress=True,
+                             pacer=None, stats=None, stats_interval=5, stats_label="", known_live=None, banner=None):
+    """异步扫描引擎：固定数量的协程从IP迭代器中按需取地址，探测存活后扫描端口
+    Args:
+        ips: IP地址可迭代对象，可以是惰性生成器
+        ports: 要扫描的端口列表
+        concurrency: 同时探测的主机数上限
+        timeout: 单次探测超时时间，指定policy时由RTT估计决定
+        method: 存活探测方式 auto / icmp / tcp，auto在允许ICMP数据报套接字时使用ICMP，否则使用TCP
+        total: 地址总数，仅用于显示进度
+        retries: 端口扫描的重试次数，指定policy时由RTT估计决定
+        on_result: 每发现一个活跃设备调用一次的回调
+        resolver: 反向DNS解析器，默认创建一个不持久化的HostnameResolver
+        policy: 自适应超时策略TimeoutPolicy，为None时使用固定超时
+        on_dead: 主机未响应时调用的回调
+        show_progress: 是否在终端显示进度
+        pacer: 探测速率控制ProbePacer，为None时不限速
+        stats: 扫描统计ScanStats，为None时不统计
+        stats_interval: 周期性输出统计的间隔（秒），0表示不输出
+        stats_label: 周期性输出时的前缀
+        known_live: 已知在线的IP集合（如邻居表中的主机），跳过存活探测直接扫描端口
+        banner: BannerGrabber，指定时抓取开放端口的服务横幅，记入设备记录的Banners字段
+    Returns:
+        list: 活跃设备列表；指定on_result时结果只交给回调，不在内存中累积，返回空列表
+    """
+    pinger = open_pinger(method, asyncio.get_running_loop())
+    own_resolver = resolver is None
+    if own_resolver:
+        resolver = HostnameResolver()
+
+    known_live = set(known_live or ())
+    ip_iter = iter(ips)
+    devices = []
+    completed = 0
+
+    async def resolve(ip):
+        start = time.monotonic()
+        hostname = await resolver.resolve(ip)
+        if stats:
+            stats.observe("dns", time.monotonic() - start)
+        return hostname
+
+    async def worker():
+        nonlocal completed
+        for ip in ip_iter:
+            ip = str(ip)
+            if stats:
+                stats.inflight_hosts += 1
+            probe_timeout = policy.timeout(ip) if policy else timeout
+            if ip in known_live:
+                alive = True
+                if stats:
+                    stats.incr("hosts_neighbor")
+            else:
+                alive = await probe_alive(ip, pinger, probe_timeout, policy, pacer, stats)
+            if alive:
+                banners = {} if banner else None
+                # 反向解析与端口扫描同时进行，慢速DNS不会拖慢探测
+                hostname, port_results = await asyncio.gather(
+                    resolve(ip),
+                    async_scan_port(ip, ports=ports, timeout=timeout, retries=retries, policy=policy, pacer=pacer,
+                                    stats=stats, banner=banner, banners=banners)
+                )
+                device = {
+                    "IP": ip,
+                    "Hostname": hostname,
+                    "Ports": port_results
+                }
+                if banner:
+                    device["Banners"] = {port: banners[port] for port in ports if port in banners}
+                if policy:
+                    device["Timeout"] = round(policy.timeout(ip), 3)
+                if on_result:
+                    on_result(device)
+                else:
+                    devices.append(device)
+                logger.info(f"发现活跃设备: IP={ip}, 主机名={hostname}, 端口状态={port_results}")
+            elif on_dead:
+                on_dead(ip)
+            completed += 1
+            if stats:
+                stats.inflight_hosts -= 1
+                stats.incr("hosts_done")
+                if alive:
+                    stats.incr("hosts_alive")
+            if alive and show_progress:
+                # 显示扫描进度
+                if total:
+                    progress = (completed / total) * 100
+                    print(f"\r扫描进度: {progress:.1f}% ({completed}/{total})", end="")
+                else:
+                    print(f"\r已扫描: {completed}", end="")
+
+    reporter = None
+    if stats and stats_interval:
+        reporter = asyncio.ensure_future(report_stats(stats, stats_interval, total, stats_label))
+    try:
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    finally:
+        if reporter:
+            reporter.cancel()
+        if pinger:
+            pinger.close()
+        if own_resolver:
+            resolver.close()
+    return devices
+
+class Scanner:
+    """可嵌入的扫描器：配置、超时策略、限速器、统计和DNS缓存都属于实例，扫描结果作为返回值交给调用方
+    同一进程内可以同时存在多个Scanner，互不干扰；超时策略在同一实例的多次扫描之间保留，RTT估计越用越准。
+    用法:
+        with Scanner(ports=[22, 80], on_result=print) as scanner:
+            devices = scanner.scan(["192.168.1.0/24"])
+        # 在已有事件循环中（例如长期运行的服务）:
+        devices = await scanner.scan_async(["10.0.0.0/16"])
+    """
+
+    def __init__(self, ports=(445, 80, 22, 3389), concurrency=256, timeout=1, retries=2, method="auto",
+                 adaptive=True, rate=None, subnet_rate=None, rate_adapt=True,
+                 resolver=None, dns_cache=None, dns_workers=16,
+                 on_result=None, on_dead=None, keep_results=True, neighbors=False, banner=None,
+                 show_progress=False, stats_interval=0, stats_label=""):
+        """
+        Args:
+            ports: 要扫描的端口列表
+            concurrency: 同时探测的主机数上限
+            timeout: 单次探测超时时间；自适应模式下为尚无RTT样本时的初始超时
+            retries: 固定超时模式下端口扫描的重试次数
+            method: 存活探测方式 auto / icmp / tcp
+            adaptive: 是否根据RTT估计自适应调整超时和重试次数
+            rate: 全局探测速率上限（每秒探测包数），None表示不限速
+            subnet_rate: 每个/24子网的探测速率上限，可单独指定（此时全局不限速）
+            rate_adapt: 超时比例上升时是否自动降低探测速率
+            resolver: 外部传入的HostnameResolver，由调用方负责关闭；为None时按dns_cache创建并在close时关闭
+            dns_cache: 反向DNS缓存文件，None表示不持久化
+            dns_workers: 反向DNS解析线程数
+            on_result: 每发现一个活跃设备调用一次的回调
+            on_dead: 主机未响应时调用的回调
+            keep_results: 是否在scan的返回值中保留结果；只用回调处理结果时可关闭，避免在内存中累积
+            neighbors: 扫描前读取内核邻居表，表中的主机最先扫描，内核确认可达的跳过存活探测
+            banner: BannerGrabber，指定时抓取开放端口的服务横幅
+            show_progress: 是否在终端显示进度
+            stats_interval: 周期性输出统计的间隔（秒），0表示不输出
+            stats_label: 周期性输出时的前缀
+        """
+        self.ports = list(ports)
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.method = method
+        self.on_result = on_result
+        self.on_dead = on_dead
+        self.keep_results = keep_results
+        self.neighbors = neighbors
+        self.banner = banner
+        self.show_progress = show_progress
+        self.stats_interval = stats_interval
+        self.stats_label = stats_label
+        self.policy = TimeoutPolicy(initial_timeout=timeout, max_timeout=max(3, timeout * 3)) if adaptive else None
+        self.pacer = ProbePacer(rate, subnet_rate=subnet_rate, adaptive=rate_adapt) if rate or subnet_rate else None
+        self.stats = ScanStats()
+        self.own_resolver = resolver is None
+        self.resolver = resolver or HostnameResolver(cache_file=dns_cache, workers=dns_workers)
+
+    async def scan_async(self, targets=None, ranges_file=None, shuffle=False, seed=None, ips=None, total=None,
+                         known_live=None):
+        """在当前事件循环中扫描
+        Args:
+            targets: CIDR或IP字符串列表，默认扫描本机所在的/24网段
+            ranges_file: 范围文件路径，每行一个CIDR
+            shuffle: 是否随机化扫描顺序
+            seed: 随机化扫描顺序的种子
+            ips: 直接给出的IP地址可迭代对象，指定时忽略targets和ranges_file
+            total: ips的地址总数，仅用于显示进度
+            known_live: 已知在线、跳过存活探测的IP集合
+        Returns:
+            list: 活跃设备列表；keep_results为False时返回空列表
+        """
+        if ips is None:
+            networks = parse_targets(targets, ranges_file)
+            total = count_hosts(networks)
+            neighbor_ips = []
+            if self.neighbors:
+                # read_neighbors会启动子进程，不能阻塞事件循环
+                neighbors = await asyncio.get_running_loop().run_in_executor(None, read_neighbors)
+                neighbor_ips, confirmed = neighbor_hosts(networks, neighbors)
+            if neighbor_ips:
+                ips = rescan_addresses(networks, neighbor_ips, sample_rate=1.0, shuffle=shuffle, seed=seed)
+                known_live = set(known_live or ()) | set(confirmed)
+            else:
+                ips = iter_addresses(networks, shuffle=shuffle, seed=seed)
+        raise_nofile_limit()
+        devices = []
+
+        def on_result(device):
+            if self.keep_results:
+                devices.append(device)
+            if self.on_result:
+                self.on_result(device)
+
+        await async_scan_network(
+            ips, ports=self.ports, concurrency=self.concurrency, timeout=self.timeout, method=self.method,
+            total=total, retries=self.retries, on_result=on_result, resolver=self.resolver, policy=self.policy,
+            on_dead=self.on_dead, show_progress=self.show_progress, pacer=self.pacer, stats=self.stats,
+            stats_interval=self.stats_interval, stats_label=self.stats_label, known_live=known_live,
+            banner=self.banner
+        )
+        return devices
+
+    def scan(self, targets=None, ranges_file=None, shuffle=False, seed=None, ips=None, total=None, known_live=None):
+        """同步入口：在新的事件循环中运行scan_async，不能在事件循环内部调用"""
+        return asyncio.run(self.scan_async(targets, ranges_file, shuffle=shuffle, seed=seed, ips=ips, total=total,
+                                           known_live=known_live))
+
+    def report(self):
+        """各子网的RTT估计与超时报告，固定超时模式下为空"""
+        return self.policy.report() if self.policy else {}
+
+    def close(self):
+        if self.own_resolver:
+            self.resolver.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
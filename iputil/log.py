@@ -0,0 +1,13 @@
+"""日志配置
+导入iputil的各个模块不会配置日志、不会创建文件，命令行入口和调用方通过setup_logging或自己的logging配置决定输出位置
+"""
+import logging
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+def setup_logging(log_file='network_scan.log', level=logging.INFO):
+    """配置根日志记录器：同时输出到终端和日志文件，log_file为None时只输出到终端"""
+    handlers = [logging.StreamHandler()]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file))
+    logging.basicConfig(level=level, format=LOG_FORMAT, handlers=handlers)
@@ -0,0 +1,219 @@
+"""持续监控：按主机自适应间隔复查存活状态，上下线事件写入JSONL文件"""
+import time
+import heapq
+import random
+import asyncio
+import logging
+from datetime import datetime
+
+from .targets import parse_targets, iter_addresses
+from .probes import open_pinger, probe_alive, async_scan_port
+from .sinks import JsonlSink
+from .engine import Scanner
+
+logger = logging.getLogger(__name__)
+
+class HostMonitor:
+    """持续监控：首轮发现扫描建立主机清单，之后按每台主机各自的间隔复查存活状态
+    状态不变的主机复查间隔逐次翻倍直到max_interval，状态一变化就重置为min_interval，因此稳定的主机越查越少、
+    频繁抖动的主机一直保持高频复查；在线主机连续down_after次无响应才判定下线，单个丢包不会产生误报。
+    每隔sweep_interval对清单之外的地址再做一次发现扫描，下线超过forget_after秒的主机移出清单。
+    复查和发现扫描共用同一个Scanner的限速器，清单变大时复查会被推迟，探测量不会随之放大。
+    上下线以事件的形式交给on_event：{"Event": "host_up" / "host_down", "IP", "Hostname", "Time", "Ports"}
+    """
+
+    def __init__(self, min_interval=30, max_interval=900, down_after=2, sweep_interval=3600, forget_after=86400,
+                 on_event=None, stats_interval=60, **scanner_options):
+        """
+        Args:
+            min_interval: 新发现或状态刚变化的主机的复查间隔（秒）
+            max_interval: 稳定主机的最大复查间隔（秒）
+            down_after: 在线主机连续多少次无响应后判定下线
+            sweep_interval: 发现扫描的间隔（秒）
+            forget_after: 下线多久后移出清单（秒）
+            on_event: 上下线事件回调
+            stats_interval: 周期性输出监控统计的间隔（秒），0表示不输出
+            scanner_options: 传给Scanner的参数（ports、concurrency、timeout、method、rate、resolver等）
+        """
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.down_after = down_after
+        self.sweep_interval = sweep_interval
+        self.forget_after = forget_after
+        self.on_event = on_event
+        self.stats_interval = stats_interval
+        self.scanner = Scanner(on_result=self._discovered, keep_results=False, **scanner_options)
+        self.hosts = {}  # ip -> {"alive", "hostname", "interval", "misses", "last_seen", "due"}
+        self.schedule = []  # (到期时间, ip) 小顶堆，主机重新排期后旧条目按due判断作废
+        self.pinger = None
+        self.wakeup = None
+        self.checks = 0
+        self.lag = 0
+
+    async def run(self, targets=None, ranges_file=None, duration=None):
+        """运行监控直到被取消或经过duration秒"""
+        networks = parse_targets(targets, ranges_file)
+        self.pinger = open_pinger(self.scanner.method, asyncio.get_running_loop())
+        self.wakeup = asyncio.Event()
+        semaphore = asyncio.Semaphore(self.scanner.concurrency)
+        checking = set()
+        end = time.monotonic() + duration if duration else None
+        sweeper = asyncio.ensure_future(self._sweep_loop(networks))
+        reporter = asyncio.ensure_future(self._report_loop()) if self.stats_interval else None
+
+        def check_done(task):
+            checking.discard(task)
+            semaphore.release()
+
+        try:
+            while end is None or time.monotonic() < end:
+                now = time.monotonic()
+                while self.schedule and self.schedule[0][0] <= now:
+                    due, ip = heapq.heappop(self.schedule)
+                    host = self.hosts.get(ip)
+                    if not host or host["due"] != due:
+                        continue
+                    self.lag = max(self.lag, now - due)
+                    await semaphore.acquire()
+                    task = asyncio.ensure_future(self._check(ip))
+                    checking.add(task)
+                    task.add_done_callback(check_done)
+                    now = time.monotonic()
+                delay = self.schedule[0][0] - now if self.schedule else self.min_interval
+                if end is not None:
+                    delay = min(delay, end - now)
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), max(0, delay))
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            for task in [sweeper, reporter, *checking]:
+                if task:
+                    task.cancel()
+            await asyncio.gather(sweeper, *checking, return_exceptions=True)
+            if self.pinger:
+                self.pinger.close()
+
+    def close(self):
+        self.scanner.close()
+
+    def _schedule(self, ip, interval):
+        host = self.hosts[ip]
+        host["interval"] = interval
+        # 加入少量抖动，避免同一批发现的主机永远在同一时刻被复查
+        host["due"] = time.monotonic() + interval * random.uniform(0.9, 1.1)
+        heapq.heappush(self.schedule, (host["due"], ip))
+        self.wakeup.set()
+
+    def _emit(self, event, ip, host, ports=None):
+        record = {
+            "Event": event,
+            "IP": ip,
+            "Hostname": host["hostname"],
+            "Time": datetime.now().isoformat(timespec="seconds"),
+        }
+        if ports is not None:
+            record["Ports"] = [port for port, is_open in ports.items() if is_open]
+        logger.info(f"状态变化: {record}")
+        if self.on_event:
+            self.on_event(record)
+
+    def _discovered(self, device):
+        ip = device["IP"]
+        self.hosts[ip] = {"alive": True, "hostname": device["Hostname"], "interval": self.min_interval,
+                          "misses": 0, "last_seen": time.time(), "due": None}
+        self._emit("host_up", ip, self.hosts[ip], device["Ports"])
+        self._schedule(ip, self.min_interval)
+
+    async def _check(self, ip):
+        scanner = self.scanner
+        host = self.hosts[ip]
+        try:
+            timeout = scanner.policy.timeout(ip) if scanner.policy else scanner.timeout
+            alive = await probe_alive(ip, self.pinger, timeout, scanner.policy, scanner.pacer, scanner.stats)
+        except OSError as e:
+            logger.debug(f"复查异常 {ip} - {str(e)}")
+            alive = False
+        self.checks += 1
+        changed = False
+        if alive:
+            host["misses"] = 0
+            host["last_seen"] = time.time()
+            if not host["alive"]:
+                host["alive"] = changed = True
+                ports = await async_scan_port(ip, ports=scanner.ports, timeout=scanner.timeout,
+                                              retries=scanner.retries, policy=scanner.policy, pacer=scanner.pacer,
+                                              stats=scanner.stats)
+                self._emit("host_up", ip, host, ports)
+        else:
+            host["misses"] += 1
+            if host["alive"] and host["misses"] >= self.down_after:
+                host["alive"] = False
+                changed = True
+                self._emit("host_down", ip, host)
+            elif not host["alive"] and time.time() - host["last_seen"] > self.forget_after:
+                del self.hosts[ip]
+                return
+        if changed or (host["alive"] and host["misses"]):
+            # 刚变化或疑似下线的主机尽快再查一次
+            interval = self.min_interval
+        else:
+            interval = min(host["interval"] * 2, self.max_interval)
+        self._schedule(ip, interval)
+
+    async def _sweep_loop(self, networks):
+        while True:
+            start = time.monotonic()
+            known = len(self.hosts)
+            try:
+                await self.scanner.scan_async(ips=(ip for ip in iter_addresses(networks) if ip not in self.hosts))
+            except Exception:
+                # 单次发现扫描失败不能让后续的发现扫描就此停止，记录后等下一个周期再试
+                logger.exception("发现扫描失败，将在下一个周期重试")
+            else:
+                logger.info(f"发现扫描完成，用时{time.monotonic() - start:.1f}秒，"
+                            f"新增{max(0, len(self.hosts) - known)}台主机，清单共{len(self.hosts)}台")
+            await asyncio.sleep(max(0, self.sweep_interval - (time.monotonic() - start)))
+
+    async def _report_loop(self):
+        last_time, last_checks = time.monotonic(), 0
+        while True:
+            await asyncio.sleep(self.stats_interval)
+            now = time.monotonic()
+            alive = sum(1 for host in self.hosts.values() if host["alive"])
+            logger.info(f"监控: 清单 {len(self.hosts)} 在线 {alive} | "
+                        f"复查 {(self.checks - last_checks) / (now - last_time):.1f}/s | "
+                        f"最大排期延迟 {self.lag:.1f}s")
+            last_time, last_checks = now, self.checks
+            self.lag = 0
+
+MONITOR_DEFAULT_RATE = 100
+
+def monitor_network(targets=None, ranges_file=None, output=None, flush_interval=1.0, duration=None,
+                    min_interval=30, max_interval=900, down_after=2, sweep_interval=3600, stats_interval=60,
+                    rate=None, **scanner_options):
+    """持续监控入口：上下线事件追加写入JSONL文件，Ctrl+C或经过duration秒后结束
+    Args:
+        targets: CIDR或IP字符串列表，默认监控本机所在的/24网段
+        ranges_file: 范围文件路径，每行一个CIDR
+        output: 事件文件路径，默认 network_events_<时间戳>.jsonl
+        flush_interval: 事件最多在缓冲区停留多少秒
+        duration: 运行时长（秒），None表示一直运行
+        rate: 全局探测速率上限，默认MONITOR_DEFAULT_RATE，保证清单增长时探测开销有上限
+        其余参数见HostMonitor和Scanner
+    """
+    output = output or f"network_events_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl"
+    sink = JsonlSink(output, flush_every=1, flush_interval=flush_interval)
+    monitor = HostMonitor(min_interval=min_interval, max_interval=max_interval, down_after=down_after,
+                          sweep_interval=sweep_interval, stats_interval=stats_interval, on_event=sink.write,
+                          rate=rate or MONITOR_DEFAULT_RATE, **scanner_options)
+    logger.info(f"开始持续监控 (复查间隔 {min_interval}-{max_interval}秒, 发现扫描间隔 {sweep_interval}秒)")
+    try:
+        asyncio.run(monitor.run(targets, ranges_file, duration))
+    except KeyboardInterrupt:
+        logger.info("监控已停止")
+    finally:
+        monitor.close()
+        sink.close()
+        logger.info(f"事件已保存到文件: {output} (共{sink.count}条)")
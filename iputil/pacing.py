@@ -0,0 +1,210 @@
+"""自适应超时（按子网的RTT估计）与探测限速（全局和每个子网的令牌桶）"""
+import time
+import asyncio
+import threading
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+def subnet_of(ip):
+    """返回IP所在的/24子网标识"""
+    return ip.rsplit(".", 1)[0] + ".0/24"
+
+class RttEstimator:
+    """按RFC 6298维护平滑RTT（SRTT）和RTT偏差（RTTVAR）"""
+    ALPHA = 1 / 8
+    BETA = 1 / 4
+
+    def __init__(self):
+        self.srtt = None
+        self.rttvar = None
+        self.samples = 0
+
+    def update(self, rtt):
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - self.BETA) * self.rttvar + self.BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - self.ALPHA) * self.srtt + self.ALPHA * rtt
+        self.samples += 1
+
+    def rto(self):
+        return self.srtt + 4 * self.rttvar
+
+class TimeoutPolicy:
+    """自适应超时与重试策略
+    每台主机和每个/24子网各自维护RTT估计，超时取 SRTT + 4*RTTVAR，并限制在[min_timeout, max_timeout]内；
+    主机没有样本时使用所在子网的估计，子网也没有样本时使用initial_timeout。
+    重试采用指数退避，并且只在重试确实能挽回结果（说明存在丢包）时进行：
+    某子网重试了若干次却几乎从未成功，则说明超时来自防火墙过滤而非丢包，之后不再重试。
+    """
+
+    def __init__(self, initial_timeout=1, min_timeout=0.1, max_timeout=3, max_retries=2,
+                 min_retry_samples=8, min_recovery_rate=0.05):
+        self.initial_timeout = initial_timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.max_retries = max_retries
+        self.min_retry_samples = min_retry_samples
+        self.min_recovery_rate = min_recovery_rate
+        self.hosts = {}
+        self.subnets = {}
+        self.retry_stats = {}  # 子网 -> [重试次数, 挽回次数]
+
+    def estimator(self, ip):
+        estimator = self.hosts.get(ip)
+        if estimator is None:
+            estimator = self.subnets.get(subnet_of(ip))
+        return estimator
+
+    def timeout(self, ip, attempt=0):
+        """第attempt次尝试（从0开始）使用的超时时间"""
+        estimator = self.estimator(ip)
+        base = self.clamp(estimator.rto()) if estimator else self.initial_timeout
+        return min(base * (2 ** attempt), self.max_timeout)
+
+    def clamp(self, value):
+        return min(max(value, self.min_timeout), self.max_timeout)
+
+    def observe(self, ip, rtt):
+        """记录一次收到响应（SYN-ACK、RST或ICMP回复）的往返时间"""
+        self.hosts.setdefault(ip, RttEstimator()).update(rtt)
+        self.subnets.setdefault(subnet_of(ip), RttEstimator()).update(rtt)
+
+    def retries(self, ip):
+        """当前允许的重试次数"""
+        attempts, recovered = self.retry_stats.get(subnet_of(ip), (0, 0))
+        if attempts >= self.min_retry_samples and recovered / attempts < self.min_recovery_rate:
+            return 0
+        return self.max_retries
+
+    def record_retry(self, ip, recovered):
+        stats = self.retry_stats.setdefault(subnet_of(ip), [0, 0])
+        stats[0] += 1
+        stats[1] += int(recovered)
+
+    def report(self):
+        """各子网的RTT估计、当前超时和重试情况"""
+        report = {}
+        for subnet, estimator in sorted(self.subnets.items()):
+            attempts, recovered = self.retry_stats.get(subnet, (0, 0))
+            report[subnet] = {
+                "samples": estimator.samples,
+                "srtt_ms": round(estimator.srtt * 1000, 2),
+                "rttvar_ms": round(estimator.rttvar * 1000, 2),
+                "timeout_ms": round(self.clamp(estimator.rto()) * 1000, 2),
+                "retries": attempts,
+                "retries_recovered": recovered,
+            }
+        return report
+
+class TokenBucket:
+    """令牌桶，按预约方式工作：令牌可以透支，调用方按返回的等待时间睡眠，探测因此被均匀排开而不是成批发出"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst if burst is not None else max(1, rate / 100)
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+
+    def reserve(self, count=1):
+        """取走count个令牌，返回需要等待的秒数"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        self.tokens -= count
+        return 0 if self.tokens >= 0 else -self.tokens / self.rate
+
+class ProbePacer:
+    """探测速率控制：全局令牌桶（每秒探测包数）+ 可选的每/24子网令牌桶
+    adaptive=True时按AIMD调整全局速率：每window个探测统计一次超时比例，
+    比基线高出ratio_margin以上（说明交换机或对端SYN队列开始丢包）时速率减半，否则缓慢回升到设定上限。
+    基线取超时比例的慢速滑动平均，扫描大量空地址时超时比例本身很高也不会被误判为拥塞；
+    连续减速max_backoffs次后超时比例仍未回落（例如顺序扫描从有主机的网段进入空网段），说明超时与速率无关，
+    此时以当前比例重新估计基线，并恢复到开始减速前的速率。
+    rate为None时全局不限速，只按subnet_rate限制各子网（此时不做自适应调整）
+    """
+
+    def __init__(self, rate, subnet_rate=None, adaptive=True, min_rate=None, window=200, ratio_margin=0.1,
+                 max_subnets=4096, max_backoffs=3):
+        self.max_rate = rate
+        self.min_rate = min_rate or (max(1, rate / 20) if rate else None)
+        self.bucket = TokenBucket(rate) if rate else None
+        self.subnet_rate = subnet_rate
+        self.subnets = OrderedDict()
+        self.max_subnets = max_subnets
+        self.adaptive = adaptive and self.bucket is not None
+        self.window = window
+        self.ratio_margin = ratio_margin
+        self.baseline = None
+        self.max_backoffs = max_backoffs
+        self.backoffs = 0  # 连续减速的次数
+        self.backoff_from = None  # 开始连续减速前的速率
+        self.sent = 0
+        self.timeouts = 0
+        self.lock = threading.Lock()
+
+    @property
+    def rate(self):
+        """当前全局速率，不限速时为None"""
+        return self.bucket.rate if self.bucket else None
+
+    def reserve(self, ip):
+        with self.lock:
+            delay = self.bucket.reserve() if self.bucket else 0
+            if self.subnet_rate:
+                subnet = subnet_of(ip)
+                bucket = self.subnets.get(subnet)
+                if bucket is None:
+                    bucket = self.subnets[subnet] = TokenBucket(self.subnet_rate)
+                    if len(self.subnets) > self.max_subnets:
+                        self.subnets.popitem(last=False)
+                self.subnets.move_to_end(subnet)
+                delay = max(delay, bucket.reserve())
+            return delay
+
+    async def acquire(self, ip):
+        """异步等待发送一个探测包的许可"""
+        delay = self.reserve(ip)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def wait(self, ip):
+        """同步等待发送一个探测包的许可"""
+        delay = self.reserve(ip)
+        if delay > 0:
+            time.sleep(delay)
+
+    def record(self, timed_out):
+        """记录一个探测的结果，用于自适应调整速率"""
+        if not self.adaptive:
+            return
+        with self.lock:
+            self.sent += 1
+            self.timeouts += int(timed_out)
+            if self.sent < self.window:
+                return
+            ratio = self.timeouts / self.sent
+            self.sent = self.timeouts = 0
+            if self.baseline is None:
+                self.baseline = ratio
+            elif ratio > self.baseline + self.ratio_margin:
+                if not self.backoffs:
+                    self.backoff_from = self.bucket.rate
+                self.backoffs += 1
+                if self.backoffs > self.max_backoffs:
+                    self.baseline = ratio
+                    self.bucket.rate = self.backoff_from
+                    self.backoffs = 0
+                    logger.info(f"减速后超时比例仍为{ratio:.0%}，视为目标地址变化而非拥塞，"
+                                f"基线改为{ratio:.0%}，探测速率恢复到{self.bucket.rate:.0f}pps")
+                else:
+                    self.bucket.rate = max(self.min_rate, self.bucket.rate / 2)
+                    logger.info(f"超时比例升至{ratio:.0%}（基线{self.baseline:.0%}），"
+                                f"探测速率降至{self.bucket.rate:.0f}pps")
+            else:
+                self.backoffs = 0
+                self.baseline = 0.9 * self.baseline + 0.1 * ratio
+                self.bucket.rate = min(self.max_rate, self.bucket.rate + self.max_rate * 0.05)
@@ -0,0 +1,525 @@
+"""存活探测与端口探测：ICMP数据报套接字Ping、异步TCP连接探测和基于selectors的同步端口扫描
+同时打开的探测套接字数按RLIMIT_NOFILE限制，本机资源不足时重试，不会把端口判为关闭
+"""
+import errno
+import socket
+import struct
+import selectors
+import asyncio
+import threading
+import weakref
+import time
+import logging
+from collections import deque
+
+from .banners import BannerGrabber
+
+logger = logging.getLogger(__name__)
+
+# ICMP报文类型
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+# TCP存活探测端口：无论收到SYN-ACK还是RST，都说明主机在线
+LIVENESS_PORTS = [80, 443, 22, 445]
+
+def icmp_available():
+    """检测当前用户能否创建ICMP数据报套接字（Linux需net.ipv4.ping_group_range允许，macOS默认允许）"""
+    try:
+        socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP).close()
+        return True
+    except OSError:
+        return False
+
+def icmp_checksum(data):
+    """计算ICMP校验和（RFC 1071）"""
+    if len(data) % 2:
+        data += b"\0"
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+class IcmpPinger:
+    """基于ICMP数据报套接字的异步Ping
+    所有请求共用一个套接字，由事件循环读取回复并按(IP, 序号)唤醒对应的等待者，无需创建子进程。
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+        self.sock.setblocking(False)
+        self.waiters = {}
+        self.seq = 0
+        loop.add_reader(self.sock.fileno(), self._on_readable)
+
+    def _on_readable(self):
+        while True:
+            try:
+                data, addr = self.sock.recvfrom(1024)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                logger.debug(f"ICMP接收异常: {str(e)}")
+                return
+            # Linux返回的数据不含IP头，macOS包含IP头
+            if len(data) >= 20 and data[0] >> 4 == 4:
+                data = data[(data[0] & 0x0F) * 4:]
+            if len(data) < 8 or data[0] != ICMP_ECHO_REPLY:
+                continue
+            seq = struct.unpack("!H", data[6:8])[0]
+            waiter = self.waiters.pop((addr[0], seq), None)
+            if waiter is not None and not waiter.done():
+                waiter.set_result(True)
+
+    async def ping(self, ip, timeout=1):
+        """发送一个Echo请求并等待回复，超时返回False"""
+        self.seq = (self.seq + 1) & 0xFFFF
+        key = (ip, self.seq)
+        payload = b"iputil-scan"
+        header = struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, 0, 0, self.seq)
+        checksum = icmp_checksum(header + payload)
+        packet = struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, checksum, 0, self.seq) + payload
+        waiter = self.loop.create_future()
+        self.waiters[key] = waiter
+        try:
+            while True:
+                try:
+                    self.sock.sendto(packet, (ip, 0))
+                    break
+                except BlockingIOError:
+                    # 发送缓冲区已满，稍后重试
+                    await asyncio.sleep(0.001)
+            return await asyncio.wait_for(waiter, timeout)
+        except (asyncio.TimeoutError, OSError):
+            return False
+        finally:
+            self.waiters.pop(key, None)
+
+    def close(self):
+        self.loop.remove_reader(self.sock.fileno())
+        self.sock.close()
+
+# 本机文件描述符或内核缓冲区耗尽：说明不了端口的状态，稍后重试即可，不能当作端口关闭
+RESOURCE_ERRNOS = frozenset(getattr(errno, name) for name in ("EMFILE", "ENFILE", "ENOBUFS") if hasattr(errno, name))
+RESOURCE_RETRIES = 5
+RESOURCE_BACKOFF = 0.05
+# 按RLIMIT_NOFILE给探测套接字留出的余量（日志文件、DNS、ICMP套接字、结果文件等）
+RESERVED_FDS = 64
+
+def socket_budget():
+    """同时打开的探测套接字上限：RLIMIT_NOFILE的软限制减去RESERVED_FDS；无法获取（如Windows）时为1024"""
+    try:
+        import resource
+        soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    except (ImportError, ValueError, OSError):
+        return 1024
+    if soft == resource.RLIM_INFINITY:
+        return 65536
+    return max(16, soft - RESERVED_FDS)
+
+class SocketSlots:
+    """进程内同步探测（connect_round）共用的套接字配额，线程安全
+    上限在首次使用时按socket_budget()确定；仍然遇到EMFILE等错误时（其他代码也占用了描述符）调用shrink降低上限
+    """
+
+    def __init__(self, limit=None):
+        self.limit = limit or socket_budget()
+        self.used = 0
+        self.cond = threading.Condition()
+
+    def try_acquire(self):
+        with self.cond:
+            if self.used < self.limit:
+                self.used += 1
+                return True
+            return False
+
+    def acquire(self):
+        with self.cond:
+            while self.used >= self.limit:
+                self.cond.wait()
+            self.used += 1
+
+    def release(self):
+        with self.cond:
+            self.used -= 1
+            self.cond.notify()
+
+    def shrink(self):
+        with self.cond:
+            limit = max(1, self.used)
+            if limit < self.limit:
+                logger.warning(f"本机文件描述符不足，探测套接字上限从{self.limit}降为{limit}")
+                self.limit = limit
+
+_socket_slots = None
+_socket_slots_lock = threading.Lock()
+# 异步探测的配额按事件循环各建一个信号量
+_loop_slots = weakref.WeakKeyDictionary()
+
+def socket_slots():
+    """同步探测共用的SocketSlots，首次调用时创建（此时raise_nofile_limit通常已经生效）"""
+    global _socket_slots
+    with _socket_slots_lock:
+        if _socket_slots is None:
+            _socket_slots = SocketSlots()
+        return _socket_slots
+
+def connection_slots():
+    """当前事件循环中异步探测共用的信号量，限制同时打开的连接数"""
+    loop = asyncio.get_running_loop()
+    slots = _loop_slots.get(loop)
+    if slots is None:
+        slots = _loop_slots[loop] = asyncio.Semaphore(socket_budget())
+    return slots
+
+async def tcp_probe(ip, port, timeout=1, policy=None, pacer=None, stats=None, on_open=None):
+    """异步TCP连接探测，收到响应时把RTT记入policy，发送前按pacer限速，结果计入stats
+    同时打开的连接数受connection_slots()限制；本机资源不足（EMFILE/ENFILE/ENOBUFS）时等待片刻重试，
+    重试RESOURCE_RETRIES次仍失败则返回"error"，调用方应按超时处理而不是判为关闭。
+    指定on_open时，端口开放后先以(reader, writer)调用该协程（如抓取横幅），再关闭连接
+    Returns:
+        str: "open"(收到SYN-ACK) / "closed"(收到RST) / "timeout"(无响应) / "unreachable"(主机不可达)
+             / "error"(本机资源不足)
+    """
+    async with connection_slots():
+        if pacer:
+            await pacer.acquire(str(ip))
+        if stats:
+            stats.probe_started()
+        state = "unreachable"
+        writer = None
+        try:
+            for attempt in range(RESOURCE_RETRIES + 1):
+                start = time.monotonic()
+                try:
+                    reader, writer = await asyncio.wait_for(asyncio.open_connection(str(ip), port), timeout)
+                    state = "open"
+                except asyncio.TimeoutError:
+                    state = "timeout"
+                except ConnectionRefusedError:
+                    state = "closed"
+                except OSError as e:
+                    if e.errno not in RESOURCE_ERRNOS:
+                        state = "unreachable"
+                        break
+                    state = "error"
+                    if stats:
+                        stats.incr("resource_errors")
+                    if attempt < RESOURCE_RETRIES:
+                        await asyncio.sleep(RESOURCE_BACKOFF * (attempt + 1))
+                        continue
+                break
+        finally:
+            elapsed = time.monotonic() - start
+            answered = state in ("open", "closed")
+            if stats:
+                stats.probe_done("connect", elapsed if answered else None, state in ("timeout", "error"))
+        if pacer and state in ("open", "closed", "timeout"):
+            pacer.record(state == "timeout")
+        if policy and answered:
+            policy.observe(str(ip), elapsed)
+        if writer:
+            try:
+                if on_open:
+                    await on_open(reader, writer)
+            finally:
+                writer.close()
+        return state
+
+async def tcp_alive(ip, ports=LIVENESS_PORTS, timeout=1, policy=None, pacer=None, stats=None):
+    """通过并发TCP连接检测主机是否在线（无需特权）"""
+    states = await asyncio.gather(*(tcp_probe(ip, port, timeout, policy, pacer, stats) for port in ports))
+    return any(state in ("open", "closed") for state in states)
+
+def open_pinger(method, loop):
+    """按存活探测方式创建IcmpPinger；method为tcp或无权创建ICMP套接字时返回None，改用TCP探测"""
+    pinger = None
+    if method in ("auto", "icmp"):
+        if icmp_available():
+            pinger = IcmpPinger(loop)
+        elif method == "icmp":
+            logger.warning("当前用户无权创建ICMP数据报套接字，改用TCP存活探测")
+    logger.info(f"存活探测方式: {'ICMP' if pinger else 'TCP'}")
+    return pinger
+
+async def probe_alive(ip, pinger=None, timeout=1, policy=None, pacer=None, stats=None):
+    """探测单台主机是否在线：有pinger时发送ICMP Echo，否则使用TCP连接探测"""
+    if not pinger:
+        return await tcp_alive(ip, timeout=timeout, policy=policy, pacer=pacer, stats=stats)
+    if pacer:
+        await pacer.acquire(ip)
+    if stats:
+        stats.probe_started()
+    start = time.monotonic()
+    alive = await pinger.ping(ip, timeout)
+    elapsed = time.monotonic() - start
+    if stats:
+        stats.probe_done("ping", elapsed if alive else None, not alive)
+    if pacer:
+        pacer.record(not alive)
+    if alive and policy:
+        policy.observe(ip, elapsed)
+    return alive
+
+def raise_nofile_limit():
+    """尽量提高进程可打开的文件描述符上限，避免高并发时耗尽套接字"""
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft < hard:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ImportError, ValueError, OSError):
+        pass
+
+def connect_round(ip, ports, timeout, results, policy=None, pacer=None, stats=None, banner=None, banners=None):
+    """用非阻塞套接字并发发起一轮TCP连接，由selectors等待结果
+    同时打开的套接字数受进程内配额socket_slots()限制：配额用完时先等已发起的连接出结果，再发起后面的端口，
+    每个端口的超时从它发起连接时算起。本机资源不足（EMFILE等）的端口不判为关闭，而是留待稍后或下一轮重试。
+    已得出结论（开放/关闭）的端口写入results，返回超时未响应以及因资源不足未能探测的端口列表；
+    指定banner时，开放端口的连接不立即关闭，而是在同一个selector里发送握手并读取横幅，结果写入banners
+    """
+    selector = selectors.DefaultSelector()
+    slots = socket_slots()
+    queue = deque(dict.fromkeys(ports))
+    pending = {}  # port -> socket，按发起顺序排列，第一个就是最早到期的
+    reading = {}  # port -> (socket, 横幅读取截止时间)
+    started = {}
+    timed_out = []
+    starved = 0  # 没有占用任何套接字时连续遇到资源不足的次数
+
+    def release(s):
+        s.close()
+        slots.release()
+
+    def start_banner(port, s):
+        hello = banner.hello(port)
+        try:
+            if hello:
+                s.send(hello)
+        except OSError:
+            release(s)
+            return
+        selector.register(s, selectors.EVENT_READ, port)
+        reading[port] = (s, time.monotonic() + banner.timeout)
+
+    def finish_banner(port, data):
+        s, banner_deadline = reading.pop(port)
+        selector.unregister(s)
+        release(s)
+        summary = BannerGrabber.summarize(data) if data else None
+        if summary:
+            banners[port] = summary
+            if stats:
+                stats.observe("banner", time.monotonic() - (banner_deadline - banner.timeout))
+
+    def out_of_resources():
+        slots.shrink()
+        if stats:
+            stats.incr("resource_errors")
+
+    def start_connects():
+        """在配额内发起队列中端口的连接；遇到资源不足返回False"""
+        while queue:
+            if pending or reading:
+                if not slots.try_acquire():
+                    return True
+            else:
+                slots.acquire()  # 本轮没有占用任何套接字，阻塞等待配额不会与其他线程互相等待
+            if pacer:
+                pacer.wait(ip)
+            try:
+                s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            except OSError as e:
+                slots.release()
+                if e.errno not in RESOURCE_ERRNOS:
+                    raise
+                out_of_resources()
+                return False
+            s.setblocking(False)
+            port = queue[0]
+            start = time.monotonic()
+            err = s.connect_ex((ip, port))
+            if err in RESOURCE_ERRNOS:
+                release(s)
+                out_of_resources()
+                return False
+            queue.popleft()
+            started[port] = start
+            if stats:
+                stats.probe_started()
+            if err in (errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY):
+                selector.register(s, selectors.EVENT_WRITE, port)
+                pending[port] = s
+            else:
+                results[port] = err == 0
+                if stats:
+                    answered = err in (0, errno.ECONNREFUSED)
+                    stats.probe_done("connect", time.monotonic() - start if answered else None)
+                if err == 0 and banner:
+                    start_banner(port, s)
+                else:
+                    release(s)
+        return True
+
+    try:
+        while queue or pending or reading:
+            if queue and not start_connects() and not (pending or reading):
+                # 没有占用任何套接字也无法创建新的，是其他代码占满了描述符，稍等再试，多次失败后留给下一轮
+                starved += 1
+                if starved > RESOURCE_RETRIES:
+                    logger.warning(f"本机文件描述符不足，{ip} 的 {len(queue)} 个端口本轮未能探测")
+                    timed_out.extend(queue)
+                    queue.clear()
+                else:
+                    time.sleep(RESOURCE_BACKOFF * starved)
+                continue
+            starved = 0
+            now = time.monotonic()
+            for port in [port for port, (_, banner_deadline) in reading.items() if banner_deadline <= now]:
+                finish_banner(port, None)
+            while pending:
+                # 连接阶段到期的端口判为超时
+                port = next(iter(pending))
+                if started[port] + timeout > now:
+                    break
+                s = pending.pop(port)
+                selector.unregister(s)
+                release(s)
+                timed_out.append(port)
+                if pacer:
+                    pacer.record(True)
+                if stats:
+                    stats.probe_done("connect", timed_out=True)
+            deadlines = [banner_deadline for _, banner_deadline in reading.values()]
+            if pending:
+                deadlines.append(started[next(iter(pending))] + timeout)
+            if not deadlines:
+                continue
+            for key, _ in selector.select(max(0, min(deadlines) - now)):
+                port = key.data
+                if port in reading:
+                    try:
+                        data = reading[port][0].recv(banner.max_bytes)
+                    except OSError:
+                        data = None
+                    finish_banner(port, data)
+                    continue
+                s = pending.pop(port)
+                err = s.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                selector.unregister(s)
+                if err in RESOURCE_ERRNOS:
+                    # 连接过程中内核缓冲区不足，重新排队
+                    release(s)
+                    queue.append(port)
+                    out_of_resources()
+                    if stats:
+                        stats.probe_done("connect")
+                    continue
+                results[port] = err == 0
+                answered = err in (0, errno.ECONNREFUSED)
+                elapsed = time.monotonic() - started[port]
+                if policy and answered:
+                    policy.observe(ip, elapsed)
+                if stats:
+                    stats.probe_done("connect", elapsed if answered else None)
+                if pacer:
+                    pacer.record(False)
+                if err == 0 and banner:
+                    start_banner(port, s)
+                else:
+                    release(s)
+        return timed_out
+    finally:
+        for s in pending.values():
+            release(s)
+        for s, _ in reading.values():
+            release(s)
+        selector.close()
+
+def scan_port(ip, ports=[445], timeout=1, retries=2, policy=None, pacer=None, stats=None, banner=None, banners=None):
+    """检测设备是否开放指定端口（支持多端口扫描）
+    所有端口同时发起连接，整台主机只需约一个RTT；只有超时的端口才会重试，收到RST的端口直接判定为关闭
+    Args:
+        ip: 目标IP地址
+        ports: 要扫描的端口列表
+        timeout: 连接超时时间
+        retries: 重试次数
+        policy: TimeoutPolicy，指定时超时和重试次数由RTT估计决定，忽略timeout和retries
+        pacer: ProbePacer，指定时按其速率发起连接
+        stats: ScanStats，指定时记录探测次数、超时、重试和连接延迟
+        banner: BannerGrabber，指定时复用开放端口的连接抓取服务横幅
+        banners: 横幅输出字典 {port: 横幅}，与banner一起指定
+    Returns:
+        dict: 端口扫描结果字典 {port: is_open}
+    """
+    ip = str(ip)
+    results = {}
+    pending = list(dict.fromkeys(ports))
+    if policy:
+        retries = policy.retries(ip)
+    for attempt in range(retries + 1):
+        retried = len(pending) if attempt else 0
+        if stats and retried:
+            stats.incr("retries", retried)
+        try:
+            round_timeout = policy.timeout(ip, attempt) if policy else timeout
+            pending = connect_round(ip, pending, round_timeout, results, policy, pacer, stats,
+                                    banner if banners is not None else None, banners)
+        except OSError as e:
+            logger.debug(f"端口扫描异常 {ip} - {str(e)}")
+        if policy and retried:
+            for i in range(retried):
+                policy.record_retry(ip, i >= len(pending))
+        if not pending:
+            break
+    for port in ports:
+        results.setdefault(port, False)
+        logger.debug(f"端口扫描 {ip}:{port} - {'开放' if results[port] else '关闭'}")
+    return {port: results[port] for port in ports}
+
+async def async_scan_port(ip, ports=[445], timeout=1, retries=2, policy=None, pacer=None, stats=None,
+                          banner=None, banners=None):
+    """异步版端口扫描，语义与scan_port一致：所有端口并发探测，仅对超时（以及本机资源不足未能探测）的端口重试
+    指定banner和banners时，各开放端口在自己的探测协程里抓取横幅，与其余端口的探测同时进行
+    """
+    ip = str(ip)
+    results = {}
+    pending = list(dict.fromkeys(ports))
+
+    def grabber(port):
+        if banner is None or banners is None:
+            return None
+
+        async def on_open(reader, writer):
+            start = time.monotonic()
+            summary = await banner.grab(reader, writer, port)
+            if summary:
+                banners[port] = summary
+                if stats:
+                    stats.observe("banner", time.monotonic() - start)
+        return on_open
+
+    if policy:
+        retries = policy.retries(ip)
+    for attempt in range(retries + 1):
+        round_timeout = policy.timeout(ip, attempt) if policy else timeout
+        if stats and attempt:
+            stats.incr("retries", len(pending))
+        states = await asyncio.gather(*(tcp_probe(ip, port, round_timeout, policy, pacer, stats, grabber(port))
+                                        for port in pending))
+        timed_out = []
+        for port, state in zip(pending, states):
+            if policy and attempt:
+                policy.record_retry(ip, state not in ("timeout", "error"))
+            if state in ("timeout", "error") and attempt < retries:
+                timed_out.append(port)
+            else:
+                results[port] = state == "open"
+                if state == "error":
+                    logger.warning(f"本机文件描述符不足，{ip}:{port} 未能探测，按关闭处理")
+                logger.debug(f"端口扫描 {ip}:{port} - {'开放' if results[port] else '关闭'}")
+        pending = timed_out
+        if not pending:
+            break
+    return {port: results[port] for port in ports}
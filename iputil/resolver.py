@@ -0,0 +1,122 @@
+"""反向DNS解析：专用线程池查询，结果放入带TTL的LRU缓存，可在多次运行之间持久化"""
+import os
+import socket
+import asyncio
+import threading
+import json
+import time
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+def get_hostname(ip):
+    """尝试解析IP的主机名"""
+    try:
+        hostname = socket.gethostbyaddr(str(ip))[0]
+        logger.debug(f"成功解析主机名 {ip} -> {hostname}")
+        return hostname
+    except (socket.herror, socket.gaierror) as e:
+        logger.debug(f"无法解析主机名 {ip}: {str(e)}")
+        return "N/A"
+
+class HostnameResolver:
+    """反向DNS解析器
+    解析在专用线程池中执行，不占用探测协程；结果放入带正/负TTL的LRU缓存，
+    指定cache_file时缓存在多次运行之间持久化，重复扫描同一网段无需再次查询DNS
+    """
+
+    def __init__(self, cache_file=None, workers=16, maxsize=65536, positive_ttl=86400, negative_ttl=600,
+                 readonly=False):
+        self.cache_file = cache_file
+        self.readonly = readonly
+        self.maxsize = maxsize
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.cache = OrderedDict()  # ip -> (hostname, 过期时间戳)
+        self.lock = threading.Lock()
+        from concurrent.futures import ThreadPoolExecutor
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="resolver")
+        self.hits = 0
+        self.misses = 0
+        if cache_file:
+            self.load()
+
+    def get(self, ip):
+        """查询缓存，未命中或已过期返回None"""
+        with self.lock:
+            entry = self.cache.get(ip)
+            if entry is None:
+                return None
+            if entry[1] < time.time():
+                del self.cache[ip]
+                return None
+            self.cache.move_to_end(ip)
+            return entry[0]
+
+    def put(self, ip, hostname):
+        ttl = self.negative_ttl if hostname == "N/A" else self.positive_ttl
+        with self.lock:
+            self.cache[ip] = (hostname, time.time() + ttl)
+            self.cache.move_to_end(ip)
+            while len(self.cache) > self.maxsize:
+                self.cache.popitem(last=False)
+
+    def lookup(self, ip):
+        """同步解析（带缓存）"""
+        ip = str(ip)
+        hostname = self.get(ip)
+        if hostname is not None:
+            self.hits += 1
+            return hostname
+        self.misses += 1
+        hostname = get_hostname(ip)
+        self.put(ip, hostname)
+        return hostname
+
+    async def resolve(self, ip):
+        """异步解析（带缓存），实际查询交给解析线程池"""
+        ip = str(ip)
+        hostname = self.get(ip)
+        if hostname is not None:
+            self.hits += 1
+            return hostname
+        self.misses += 1
+        hostname = await asyncio.get_running_loop().run_in_executor(self.executor, get_hostname, ip)
+        self.put(ip, hostname)
+        return hostname
+
+    def load(self):
+        try:
+            with open(self.cache_file, encoding="utf-8") as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取DNS缓存失败: {str(e)}")
+            return
+        now = time.time()
+        for ip, (hostname, expires_at) in entries.items():
+            if expires_at >= now:
+                self.cache[ip] = (hostname, expires_at)
+        logger.info(f"已加载{len(self.cache)}条DNS缓存")
+
+    def save(self):
+        """先写临时文件再替换，避免中断时留下损坏的缓存"""
+        if not self.cache_file:
+            return
+        with self.lock:
+            entries = {ip: list(entry) for ip, entry in self.cache.items()}
+        tmp_file = f"{self.cache_file}.tmp"
+        try:
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                json.dump(entries, f, ensure_ascii=False)
+            os.replace(tmp_file, self.cache_file)
+        except OSError as e:
+            logger.warning(f"保存DNS缓存失败: {str(e)}")
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        if not self.readonly:
+            self.save()
+        logger.info(f"DNS缓存命中{self.hits}次，查询{self.misses}次")
@@ -0,0 +1,99 @@
+"""多进程分片扫描：地址空间交错切分给spawn出的子进程，结果经队列回到父进程"""
+import logging
+from queue import Empty
+
+from .log import LOG_FORMAT
+from .targets import iter_addresses, rescan_addresses
+from .resolver import HostnameResolver
+from .engine import Scanner
+
+logger = logging.getLogger(__name__)
+
+def scan_shard(shard, shards, result_queue, networks, options):
+    """分片扫描子进程入口：在自己的事件循环中扫描地址空间的第shard个分片
+    结果以消息的形式经队列交给父进程：("result", 设备) / ("dead", ip) / ("done", shard, 子网超时报告, 统计数据)
+    """
+    # spawn出的子进程没有继承父进程的日志配置，按父进程的级别输出到终端
+    logging.basicConfig(level=options["log_level"], format=LOG_FORMAT)
+    watch = options["watch"]
+    if options["rescan"]:
+        ips = rescan_addresses(networks, options["known_live"], sample_rate=options["sample_rate"],
+                               shuffle=options["shuffle"], seed=options["seed"], shard=shard, shards=shards)
+    elif options["neighbors"]:
+        ips = rescan_addresses(networks, options["neighbors"], sample_rate=1.0,
+                               shuffle=options["shuffle"], seed=options["seed"], shard=shard, shards=shards)
+    else:
+        ips = iter_addresses(networks, shuffle=options["shuffle"], seed=options["seed"], shard=shard, shards=shards)
+
+    def on_dead(ip):
+        if ip in watch:
+            result_queue.put(("dead", ip))
+
+    # 速率限制在各分片间平分；子进程只读DNS缓存，新的解析结果随设备记录回到父进程后由父进程统一保存
+    scanner = Scanner(
+        ports=options["ports"], concurrency=options["concurrency"], timeout=options["timeout"],
+        method=options["method"], adaptive=options["adaptive"],
+        rate=options["rate"] / shards if options["rate"] else None,
+        subnet_rate=options["subnet_rate"] / shards if options["subnet_rate"] else None,
+        rate_adapt=options["rate_adapt"], banner=options["banner"],
+        resolver=HostnameResolver(cache_file=options["dns_cache"], workers=options["dns_workers"], readonly=True),
+        on_result=lambda device: result_queue.put(("result", device)), on_dead=on_dead, keep_results=False,
+        stats_interval=options["stats_interval"], stats_label=f"[进程{shard}] "
+    )
+    try:
+        scanner.scan(ips=ips, known_live=options["confirmed"])
+    except KeyboardInterrupt:
+        pass
+    finally:
+        scanner.resolver.close()
+        result_queue.put(("done", shard, scanner.report(), scanner.stats.snapshot()))
+
+def run_shards(shards, networks, options, on_result, on_dead, stats=None):
+    """启动shards个子进程分片扫描，在父进程中把各分片的结果依次交给同一组回调，各分片的统计合并到stats
+    Returns:
+        dict: 合并后的子网超时报告
+    """
+    import multiprocessing
+    # 父进程已有写线程和解析线程，fork可能继承被占用的锁，统一使用spawn
+    ctx = multiprocessing.get_context("spawn")
+    result_queue = ctx.Queue(maxsize=10000)
+    processes = [
+        ctx.Process(target=scan_shard, args=(shard, shards, result_queue, networks, options), daemon=True)
+        for shard in range(shards)
+    ]
+    for process in processes:
+        process.start()
+    logger.info(f"已启动{shards}个扫描进程")
+
+    report = {}
+    finished = set()
+    found = 0
+    try:
+        while len(finished) < shards:
+            try:
+                message = result_queue.get(timeout=0.5)
+            except Empty:
+                for shard, process in enumerate(processes):
+                    if shard not in finished and not process.is_alive():
+                        logger.error(f"扫描进程{shard}异常退出 (exitcode={process.exitcode})")
+                        finished.add(shard)
+                continue
+            if message[0] == "result":
+                on_result(message[1])
+                found += 1
+                print(f"\r已发现: {found} (完成分片 {len(finished)}/{shards})", end="")
+            elif message[0] == "dead":
+                on_dead(message[1])
+            else:
+                finished.add(message[1])
+                for subnet, subnet_stats in message[2].items():
+                    if subnet not in report or subnet_stats["samples"] > report[subnet]["samples"]:
+                        report[subnet] = subnet_stats
+                if stats:
+                    stats.merge(message[3])
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+    return report
@@ -0,0 +1,106 @@
+"""增量结果写入器：CSV / JSON Lines，由单独的写线程批量刷盘"""
+import json
+import threading
+import time
+import logging
+from queue import Queue, Empty
+
+logger = logging.getLogger(__name__)
+
+class ResultSink:
+    """增量结果写入器基类
+    扫描协程只把记录放入队列，由单独的写线程负责格式化和写盘，不需要任何全局锁；
+    累计flush_every条或距第一条未刷新记录超过flush_interval秒时刷新到磁盘，中断时最多丢失一个批次
+    """
+    _STOP = object()
+
+    def __init__(self, path, flush_every=100, flush_interval=1.0):
+        self.path = path
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.count = 0
+        self.file = open(path, "a", encoding="utf-8", newline="")
+        self.queue = Queue()
+        self.thread = threading.Thread(target=self._run, name="result-sink", daemon=True)
+        self.thread.start()
+
+    def write(self, record):
+        """提交一条设备记录，立即返回"""
+        self.queue.put(record)
+
+    def close(self):
+        """写完队列中剩余的记录并关闭文件"""
+        self.queue.put(self._STOP)
+        self.thread.join()
+        self.file.close()
+
+    def write_record(self, record):
+        raise NotImplementedError
+
+    def _run(self):
+        pending = 0
+        first_pending_at = 0
+        while True:
+            timeout = None
+            if pending:
+                timeout = max(0, self.flush_interval - (time.monotonic() - first_pending_at))
+            try:
+                record = self.queue.get(timeout=timeout)
+            except Empty:
+                record = None
+            if record is self._STOP:
+                break
+            if record is not None:
+                try:
+                    self.write_record(record)
+                    self.count += 1
+                except Exception as e:
+                    logger.error(f"写入扫描结果失败: {str(e)}")
+                    continue
+                if not pending:
+                    first_pending_at = time.monotonic()
+                pending += 1
+            if pending and (pending >= self.flush_every or time.monotonic() - first_pending_at >= self.flush_interval):
+                self.file.flush()
+                pending = 0
+        self.file.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class CsvSink(ResultSink):
+    """CSV格式：IP,Hostname,Port_xx...（抓取横幅时再加Banner_xx...），文件为空时先写表头"""
+
+    def __init__(self, path, ports, banners=False, **kwargs):
+        import csv
+        super().__init__(path, **kwargs)
+        self.ports = list(ports)
+        self.banners = banners
+        self.writer = csv.writer(self.file)
+        if self.file.tell() == 0:
+            header = ["IP", "Hostname"] + [f"Port_{port}" for port in self.ports]
+            if banners:
+                header += [f"Banner_{port}" for port in self.ports]
+            self.writer.writerow(header)
+
+    def write_record(self, record):
+        row = [record["IP"], record["Hostname"]] + [str(record["Ports"].get(port, False)) for port in self.ports]
+        if self.banners:
+            row += [record.get("Banners", {}).get(port, "") for port in self.ports]
+        self.writer.writerow(row)
+
+class JsonlSink(ResultSink):
+    """JSON Lines格式：每行一条设备记录"""
+
+    def write_record(self, record):
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+def open_sink(path, ports, output_format=None, banners=False, **kwargs):
+    """按格式（未指定时按扩展名推断）创建结果写入器"""
+    output_format = output_format or ("jsonl" if path.endswith((".jsonl", ".json")) else "csv")
+    if output_format == "jsonl":
+        return JsonlSink(path, **kwargs)
+    return CsvSink(path, ports, banners=banners, **kwargs)
@@ -0,0 +1,88 @@
+"""差异扫描用的SQLite扫描状态库"""
+import time
+
+from .targets import in_networks
+
+class ScanState:
+    """SQLite扫描状态库：保存每个IP及其端口最近一次的状态，用于差异扫描
+    只记录出现过的在线主机，死区地址不入库，库的大小与网段大小无关
+    """
+
+    def __init__(self, path, commit_every=500):
+        import sqlite3
+        self.path = path
+        self.commit_every = commit_every
+        self.uncommitted = 0
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS hosts (
+                ip TEXT PRIMARY KEY,
+                alive INTEGER NOT NULL,
+                hostname TEXT,
+                last_seen REAL,
+                last_checked REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS ports (
+                ip TEXT NOT NULL,
+                port INTEGER NOT NULL,
+                open INTEGER NOT NULL,
+                last_checked REAL NOT NULL,
+                PRIMARY KEY (ip, port)
+            );
+        """)
+
+    def live_hosts(self, networks=None):
+        """上次扫描时在线的主机（可按网段过滤）"""
+        return in_networks((row[0] for row in self.conn.execute("SELECT ip FROM hosts WHERE alive = 1")), networks)
+
+    def known_hosts(self, networks=None):
+        """状态库中记录过的全部主机（可按网段过滤）"""
+        return in_networks((row[0] for row in self.conn.execute("SELECT ip FROM hosts")), networks)
+
+    def update_host(self, device):
+        """写入一台在线主机的扫描结果，返回与上次状态相比的变化列表"""
+        ip = device["IP"]
+        now = time.time()
+        changes = []
+        row = self.conn.execute("SELECT alive FROM hosts WHERE ip = ?", (ip,)).fetchone()
+        if not row or not row[0]:
+            changes.append({
+                "Event": "host_up",
+                "IP": ip,
+                "Hostname": device["Hostname"],
+                "Ports": [port for port, is_open in device["Ports"].items() if is_open]
+            })
+        else:
+            previous = dict(self.conn.execute("SELECT port, open FROM ports WHERE ip = ?", (ip,)))
+            for port, is_open in device["Ports"].items():
+                if port in previous and bool(previous[port]) != is_open:
+                    changes.append({"Event": "port_opened" if is_open else "port_closed", "IP": ip, "Port": port})
+        self.conn.execute(
+            "INSERT OR REPLACE INTO hosts (ip, alive, hostname, last_seen, last_checked) VALUES (?, 1, ?, ?, ?)",
+            (ip, device["Hostname"], now, now)
+        )
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO ports (ip, port, open, last_checked) VALUES (?, ?, ?, ?)",
+            [(ip, port, int(is_open), now) for port, is_open in device["Ports"].items()]
+        )
+        self._maybe_commit()
+        return changes
+
+    def mark_dead(self, ip):
+        """记录一台主机未响应，若上次在线则返回host_down变化"""
+        row = self.conn.execute("SELECT alive FROM hosts WHERE ip = ?", (ip,)).fetchone()
+        if not row:
+            return []
+        self.conn.execute("UPDATE hosts SET alive = 0, last_checked = ? WHERE ip = ?", (time.time(), ip))
+        self._maybe_commit()
+        return [{"Event": "host_down", "IP": ip}] if row[0] else []
+
+    def _maybe_commit(self):
+        self.uncommitted += 1
+        if self.uncommitted >= self.commit_every:
+            self.conn.commit()
+            self.uncommitted = 0
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
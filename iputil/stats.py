@@ -0,0 +1,147 @@
+"""扫描统计：计数器、在途数量和各阶段的延迟直方图，多进程扫描时由父进程合并"""
+import time
+import json
+import bisect
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+class LatencyHistogram:
+    """固定分桶的延迟直方图（毫秒），合并和计算分位数都只需O(桶数)"""
+    BOUNDS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS_MS) + 1)
+        self.total = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, seconds):
+        ms = seconds * 1000
+        self.counts[bisect.bisect_left(self.BOUNDS_MS, ms)] += 1
+        self.total += 1
+        self.sum_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def percentile(self, q):
+        """返回第q百分位所在桶的上界"""
+        if not self.total:
+            return 0
+        rank = q / 100 * self.total
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(self.BOUNDS_MS[i], round(self.max_ms, 3)) if i < len(self.BOUNDS_MS) else self.max_ms
+        return self.max_ms
+
+    def snapshot(self):
+        return {"counts": list(self.counts), "total": self.total, "sum_ms": self.sum_ms, "max_ms": self.max_ms}
+
+    def merge(self, snapshot):
+        self.counts = [a + b for a, b in zip(self.counts, snapshot["counts"])]
+        self.total += snapshot["total"]
+        self.sum_ms += snapshot["sum_ms"]
+        self.max_ms = max(self.max_ms, snapshot["max_ms"])
+
+    def to_dict(self):
+        labels = [f"<={bound}ms" for bound in self.BOUNDS_MS] + [f">{self.BOUNDS_MS[-1]}ms"]
+        return {
+            "count": self.total,
+            "mean_ms": round(self.sum_ms / self.total, 3) if self.total else 0,
+            "p50_ms": self.percentile(50),
+            "p90_ms": self.percentile(90),
+            "p99_ms": self.percentile(99),
+            "max_ms": round(self.max_ms, 3),
+            "buckets": {label: count for label, count in zip(labels, self.counts) if count},
+        }
+
+class ScanStats:
+    """扫描统计：主机/探测吞吐、在途数量、超时与重试计数，以及ping、DNS、connect、banner各阶段的延迟直方图"""
+    STAGES = ("ping", "dns", "connect", "banner")
+    COUNTERS = ("hosts_done", "hosts_alive", "hosts_neighbor", "probes", "timeouts", "retries", "resource_errors")
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.counters = dict.fromkeys(self.COUNTERS, 0)
+        self.inflight_hosts = 0
+        self.inflight_probes = 0
+        self.histograms = {stage: LatencyHistogram() for stage in self.STAGES}
+        self._last_report = (self.started, 0, 0)
+
+    def incr(self, name, n=1):
+        self.counters[name] += n
+
+    def observe(self, stage, seconds):
+        self.histograms[stage].observe(seconds)
+
+    def probe_started(self):
+        self.inflight_probes += 1
+
+    def probe_done(self, stage, elapsed=None, timed_out=False):
+        """记录一个探测结束；elapsed为None表示没有收到响应，不计入延迟"""
+        self.inflight_probes -= 1
+        self.counters["probes"] += 1
+        if timed_out:
+            self.counters["timeouts"] += 1
+        if elapsed is not None:
+            self.histograms[stage].observe(elapsed)
+
+    def line(self, total=None):
+        """自上次调用以来的实时吞吐，用于周期性输出"""
+        now = time.monotonic()
+        last_time, last_hosts, last_probes = self._last_report
+        hosts, probes = self.counters["hosts_done"], self.counters["probes"]
+        interval = max(now - last_time, 1e-9)
+        self._last_report = (now, hosts, probes)
+        done = f"{hosts}/{total}" if total else str(hosts)
+        return (f"主机 {done} ({(hosts - last_hosts) / interval:.0f}/s) 在线 {self.counters['hosts_alive']} | "
+                f"探测 {(probes - last_probes) / interval:.0f}/s | "
+                f"在途 {self.inflight_hosts}主机/{self.inflight_probes}探测 | "
+                f"超时 {self.counters['timeouts']} 重试 {self.counters['retries']} | "
+                f"connect p50 {self.histograms['connect'].percentile(50)}ms")
+
+    def snapshot(self):
+        """可跨进程传递的原始数据"""
+        return {
+            "counters": dict(self.counters),
+            "histograms": {stage: hist.snapshot() for stage, hist in self.histograms.items()},
+        }
+
+    def merge(self, snapshot):
+        for name, value in snapshot["counters"].items():
+            self.counters[name] += value
+        for stage, hist in snapshot["histograms"].items():
+            self.histograms[stage].merge(hist)
+
+    def to_dict(self):
+        elapsed = time.monotonic() - self.started
+        probes = self.counters["probes"]
+        return {
+            "elapsed_s": round(elapsed, 3),
+            **self.counters,
+            "hosts_per_s": round(self.counters["hosts_done"] / elapsed, 1) if elapsed else 0,
+            "probes_per_s": round(probes / elapsed, 1) if elapsed else 0,
+            "timeout_ratio": round(self.counters["timeouts"] / probes, 4) if probes else 0,
+            "inflight_hosts": self.inflight_hosts,
+            "inflight_probes": self.inflight_probes,
+            "latency": {stage: hist.to_dict() for stage, hist in self.histograms.items()},
+        }
+
+async def report_stats(stats, interval, total=None, label=""):
+    """周期性输出扫描统计，直到被取消"""
+    while True:
+        await asyncio.sleep(interval)
+        logger.info(f"{label}{stats.line(total)}")
+
+def save_stats(path, stats, extra=None):
+    """把扫描统计写成JSON文件"""
+    data = stats.to_dict()
+    data.update(extra or {})
+    try:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+        logger.info(f"扫描统计已保存到文件: {path}")
+    except OSError as e:
+        logger.error(f"保存统计文件失败: {str(e)}")
@@ -0,0 +1,174 @@
+"""扫描目标：解析CIDR和范围文件，惰性生成（可随机化、可分片的）地址序列，读取内核邻居表"""
+import socket
+import struct
+import bisect
+import random
+import ipaddress
+import itertools
+import logging
+
+logger = logging.getLogger(__name__)
+
+def get_local_ip():
+    """获取本机局域网IP地址"""
+    try:
+        # 创建一个UDP套接字（不会真正发送数据）
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            s.connect(("8.8.8.8", 80))  # 连接到Google DNS
+            local_ip = s.getsockname()[0]
+        logger.info(f"获取到本机IP地址: {local_ip}")
+        return local_ip
+    except Exception as e:
+        logger.error(f"获取本机IP地址失败: {str(e)}")
+        return "127.0.0.1"
+
+def parse_targets(targets=None, ranges_file=None):
+    """把CIDR/IP列表和范围文件（每行一个CIDR，#后为注释）解析为IPv4网段列表
+    两者都未指定时使用本机所在的/24网段
+    """
+    specs = list(targets or [])
+    if ranges_file:
+        with open(ranges_file, encoding='utf-8') as f:
+            for line in f:
+                line = line.split("#", 1)[0].strip()
+                if line:
+                    specs.append(line)
+    if not specs:
+        specs = [f"{get_local_ip()}/24"]
+    networks = []
+    for spec in specs:
+        network = ipaddress.ip_network(spec, strict=False)
+        if network.version != 4:
+            raise ValueError(f"仅支持IPv4网段: {spec}")
+        networks.append(network)
+    return networks
+
+def host_bounds(network):
+    """返回网段内可用主机地址的整数区间 (first, last)，/31和/32不排除网络地址和广播地址"""
+    first = int(network.network_address)
+    last = int(network.broadcast_address)
+    if network.prefixlen < 31:
+        first, last = first + 1, last - 1
+    return first, last
+
+def count_hosts(networks):
+    """统计网段列表中的主机地址总数（不生成地址）"""
+    return sum(last - first + 1 for first, last in map(host_bounds, networks))
+
+def int_to_ip(value):
+    return socket.inet_ntoa(struct.pack("!I", value))
+
+def iter_addresses(networks, shuffle=False, seed=None, shard=0, shards=1):
+    """惰性生成网段列表中的全部主机地址，内存占用与网段大小无关
+    shuffle=True时用满周期线性同余序列（Hull-Dobell定理）在所有网段的地址下标上做伪随机置换，
+    相邻探测分散到不同子网，且无需预先生成或打乱地址列表。
+    shards>1时只产出序列中第shard、shard+shards、shard+2*shards...个地址，
+    各分片使用相同seed即可无重叠地瓜分同一序列
+    """
+    bounds = [host_bounds(network) for network in networks]
+    if not shuffle:
+        offset = 0
+        for first, last in bounds:
+            for value in range(first + (shard - offset) % shards, last + 1, shards):
+                yield int_to_ip(value)
+            offset += last - first + 1
+        return
+
+    offsets = []
+    total = 0
+    for first, last in bounds:
+        offsets.append(total)
+        total += last - first + 1
+    if total <= 0:
+        return
+    rng = random.Random(seed)
+    # 模数取不小于总数的2的幂，乘数≡1 (mod 4)、增量为奇数时序列遍历[0, size)的每个值恰好一次
+    size = max(4, 1 << (total - 1).bit_length())
+    mask = size - 1
+    multiplier = 4 * rng.randrange(1, max(size // 4, 2)) + 1
+    increment = 2 * rng.randrange(size // 2) + 1
+    index = rng.randrange(size)
+    position = 0
+    for _ in range(size):
+        index = (multiplier * index + increment) & mask
+        if index < total:
+            if position % shards == shard:
+                i = bisect.bisect_right(offsets, index) - 1
+                yield int_to_ip(bounds[i][0] + index - offsets[i])
+            position += 1
+
+def get_network_range(targets=None, ranges_file=None, shuffle=False):
+    """返回待扫描地址的惰性迭代器，默认为本机所在的局域网（如 192.168.1.0/24）
+    Args:
+        targets: CIDR或IP字符串列表
+        ranges_file: 范围文件路径，每行一个CIDR
+        shuffle: 是否随机化扫描顺序
+    """
+    return iter_addresses(parse_targets(targets, ranges_file), shuffle=shuffle)
+
+def in_networks(ips, networks):
+    """筛选出落在给定网段内的IP，networks为None时不过滤"""
+    if networks is None:
+        return list(ips)
+    bounds = [host_bounds(network) for network in networks]
+    return [ip for ip in ips if any(first <= int(ipaddress.ip_address(ip)) <= last for first, last in bounds)]
+
+# 已解析出MAC的邻居表状态；FAILED / INCOMPLETE 表示地址解析失败或尚未完成
+NEIGHBOR_STATES = {"REACHABLE", "STALE", "DELAY", "PROBE", "PERMANENT", "NOARP"}
+# 内核最近确认过可达（或静态配置）的状态，这些主机可以跳过存活探测；
+# STALE / DELAY / PROBE 表示很久没有确认过，主机可能早已离线，只提前扫描、仍要探测存活
+CONFIRMED_NEIGHBOR_STATES = {"REACHABLE", "PERMANENT"}
+ATF_COM = 0x2  # /proc/net/arp 中表示条目已完成解析的标志位
+ATF_PERM = 0x4  # /proc/net/arp 中表示静态条目的标志位
+
+def read_neighbors():
+    """读取内核邻居表（ARP缓存），返回 {IP: (MAC, 状态)}
+    优先解析 `ip -4 neigh show` 的输出，它带有条目状态；命令不可用时退回读取 /proc/net/arp，
+    其中没有可达状态，静态条目记为PERMANENT，其余记为STALE。两者都不可用（非Linux系统）时返回空字典。
+    会启动子进程，在事件循环中请放到执行器里调用。
+    """
+    import subprocess
+    neighbors = {}
+    try:
+        output = subprocess.run(["ip", "-4", "neigh", "show"], capture_output=True, text=True, timeout=2,
+                                check=True).stdout
+        # 192.168.1.1 dev eth0 lladdr aa:bb:cc:dd:ee:ff REACHABLE
+        for line in output.splitlines():
+            fields = line.split()
+            if len(fields) >= 5 and "lladdr" in fields and fields[-1] in NEIGHBOR_STATES:
+                neighbors[fields[0]] = (fields[fields.index("lladdr") + 1], fields[-1])
+        return neighbors
+    except (OSError, subprocess.SubprocessError):
+        pass
+    try:
+        with open("/proc/net/arp", encoding="ascii") as f:
+            next(f, None)  # 表头
+            for line in f:
+                fields = line.split()
+                flags = int(fields[2], 16) if len(fields) >= 4 else 0
+                if flags & ATF_COM and fields[3] != "00:00:00:00:00:00":
+                    neighbors[fields[0]] = (fields[3], "PERMANENT" if flags & ATF_PERM else "STALE")
+    except (OSError, ValueError) as e:
+        logger.debug(f"读取ARP缓存失败: {str(e)}")
+    return neighbors
+
+def neighbor_hosts(networks, neighbors=None):
+    """邻居表中落在networks内的主机，返回 (全部IP, 可跳过存活探测的IP)
+    全部IP用于安排扫描顺序（先扫描邻居），只有状态为CONFIRMED_NEIGHBOR_STATES的主机才跳过存活探测
+    """
+    if neighbors is None:
+        neighbors = read_neighbors()
+    ips = in_networks(neighbors, networks)
+    return ips, [ip for ip in ips if neighbors[ip][1] in CONFIRMED_NEIGHBOR_STATES]
+
+def rescan_addresses(networks, known_live, sample_rate=0.05, shuffle=False, seed=None, shard=0, shards=1):
+    """差异扫描与邻居表快速路径的目标顺序：先产出已知在线的主机，再按sample_rate抽样其余地址"""
+    yield from itertools.islice(sorted(known_live), shard, None, shards)
+    if sample_rate <= 0:
+        return
+    known_live = set(known_live)
+    # 各分片需要一致的只是shuffle的地址序列；抽样每次运行都要不同，否则每次差异扫描都只探测同一批死区地址
+    rng = random.Random(f"{seed}-{shard}") if seed is not None else random.Random()
+    for ip in iter_addresses(networks, shuffle=shuffle, seed=seed, shard=shard, shards=shards):
+        if ip not in known_live and rng.random() < sample_rate:
+            yield ip
@@ -1,164 +1,311 @@
+"""局域网设备扫描命令行入口：python util.py [CIDR ...]
+扫描引擎、监控、结果写入等实现在iputil包的各个模块中，这里导入后一并导出，原来 import util 的代码不受影响
+"""
 import os
-import platform
-import socket
-import subprocess
+import sys
+import json
+import random
 import ipaddress
-import threading
-import time
 import logging
 from datetime import datetime
-from queue import Queue
 
-# 配置日志记录器
-log_file = 'network_scan.log'
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(log_file),
-        logging.StreamHandler()
-    ]
+if not __package__:
+    # 作为脚本运行或被同目录的脚本以 import util 导入时，把上级目录加入路径，按包导入各模块
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from iputil.log import LOG_FORMAT, setup_logging
+from iputil.targets import (
+    get_local_ip, parse_targets, host_bounds, count_hosts, int_to_ip, iter_addresses, get_network_range, in_networks,
+    NEIGHBOR_STATES, CONFIRMED_NEIGHBOR_STATES, ATF_COM, ATF_PERM, read_neighbors, neighbor_hosts, rescan_addresses
 )
-logger = logging.getLogger(__name__)
-
-# 全局变量
-ACTIVE_DEVICES = []
-PRINT_LOCK = threading.Lock()
-
-def get_local_ip():
-    """获取本机局域网IP地址"""
-    try:
-        # 创建一个UDP套接字（不会真正发送数据）
-        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
-            s.connect(("8.8.8.8", 80))  # 连接到Google DNS
-            local_ip = s.getsockname()[0]
-        logger.info(f"获取到本机IP地址: {local_ip}")
-        return local_ip
-    except Exception as e:
-        logger.error(f"获取本机IP地址失败: {str(e)}")
-        return "127.0.0.1"
-
-def get_network_range():
-    """根据本机IP计算局域网IP范围（如 192.168.1.0/24）"""
-    local_ip = get_local_ip()
-    network = ipaddress.ip_network(f"{local_ip}/24", strict=False)
-    return network.hosts()
-
-def ping_ip(ip):
-    """通过Ping检测IP是否在线（跨平台支持）"""
-    param = "-n 1" if platform.system().lower() == "windows" else "-c 1"
-    command = ["ping", param, "-w", "1", str(ip)]
-    return subprocess.call(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) == 0
+from iputil.pacing import subnet_of, RttEstimator, TimeoutPolicy, TokenBucket, ProbePacer
+from iputil.stats import LatencyHistogram, ScanStats, report_stats, save_stats
+from iputil.banners import smb_negotiate_request, BANNER_HELLOS, BANNER_PORTS, BannerGrabber
+from iputil.probes import (
+    ICMP_ECHO_REQUEST, ICMP_ECHO_REPLY, LIVENESS_PORTS, icmp_available, icmp_checksum, IcmpPinger, RESOURCE_ERRNOS,
+    RESOURCE_RETRIES, RESOURCE_BACKOFF, RESERVED_FDS, socket_budget, SocketSlots, socket_slots, connection_slots,
+    tcp_probe, tcp_alive, open_pinger, probe_alive, raise_nofile_limit, connect_round, scan_port, async_scan_port
+)
+from iputil.resolver import get_hostname, HostnameResolver
+from iputil.sinks import ResultSink, CsvSink, JsonlSink, open_sink
+from iputil.state import ScanState
+from iputil.engine import async_scan_network, Scanner
+from iputil.monitor import HostMonitor, MONITOR_DEFAULT_RATE, monitor_network
+from iputil.shards import scan_shard, run_shards
 
-def get_hostname(ip):
-    """尝试解析IP的主机名"""
-    try:
-        hostname = socket.gethostbyaddr(str(ip))[0]
-        logger.debug(f"成功解析主机名 {ip} -> {hostname}")
-        return hostname
-    except (socket.herror, socket.gaierror) as e:
-        logger.debug(f"无法解析主机名 {ip}: {str(e)}")
-        return "N/A"
+# 各模块的日志记录器都是它的子记录器，调整它的级别对整个包生效
+logger = logging.getLogger("iputil")
 
-def scan_port(ip, ports=[445], timeout=1, retries=2):
-    """检测设备是否开放指定端口（支持多端口扫描）
+def scan_network(concurrency=256, ports=[445, 80, 22, 3389], timeout=1, method="auto",
+                 targets=None, ranges_file=None, shuffle=False,
+                 output=None, output_format=None, flush_every=100, flush_interval=1.0, show_table=True,
+                 dns_cache="dns_cache.json", dns_workers=16, adaptive=True,
+                 state_file=None, rescan=False, sample_rate=0.05, workers=1,
+                 rate=None, subnet_rate=None, rate_adapt=True, stats_interval=5, stats_file=None, neighbors=True,
+                 banners=False, banner_timeout=0.5, banner_bytes=512, banner_hellos=True):
+    """主扫描函数
     Args:
-        ip: 目标IP地址
-        ports: 要扫描的端口列表
-        timeout: 连接超时时间
-        retries: 重试次数
+        concurrency: 同时探测的主机数上限（多进程模式下为每个进程的上限）
+        ports: 要扫描的端口列表，默认包含常用服务端口
+        timeout: 单次探测超时时间；自适应模式下为尚无RTT样本时的初始超时
+        method: 存活探测方式 auto / icmp / tcp
+        targets: CIDR或IP字符串列表，默认扫描本机所在的/24网段
+        ranges_file: 范围文件路径，每行一个CIDR
+        shuffle: 是否随机化扫描顺序，把负载分散到各个子网
+        output: 结果文件路径，默认 network_scan_<时间戳>.csv；发现设备即追加写入
+        output_format: csv / jsonl，默认按扩展名推断
+        flush_every: 累计多少条记录刷新一次文件
+        flush_interval: 记录最多在缓冲区停留多少秒
+        show_table: 扫描结束后是否打印结果表；大范围扫描可关闭，避免结果在内存中累积
+        dns_cache: 反向DNS缓存文件，None表示不持久化
+        dns_workers: 反向DNS解析线程数
+        adaptive: 是否根据RTT估计自适应调整超时和重试次数
+        state_file: SQLite扫描状态库路径，指定时每次扫描都会更新各IP和端口的最近状态
+        rescan: 差异扫描模式（需要state_file）：先探测上次在线的主机，再按sample_rate抽样其余地址，
+            结果文件只输出变化（host_up / host_down / port_opened / port_closed）
+        sample_rate: 差异扫描时对上次不在线地址的抽样比例
+        workers: 扫描进程数，大于1时把地址空间交错切分为workers个分片，各进程运行自己的事件循环，
+            结果回到本进程后由同一个写入器按到达顺序写出
+        rate: 全局探测速率上限（每秒探测包数），None表示不限速
+        subnet_rate: 每个/24子网的探测速率上限，可单独指定（此时全局不限速）
+        rate_adapt: 超时比例上升时是否自动降低探测速率
+        stats_interval: 周期性输出吞吐、在途数量、超时和延迟统计的间隔（秒），0表示不输出
+        stats_file: 扫描结束时写出的JSON统计文件，默认 network_stats_<时间戳>.json
+        neighbors: 是否读取内核邻居表（ip neigh / /proc/net/arp），表中的主机最先扫描；
+            只有REACHABLE/PERMANENT状态的主机跳过存活探测，STALE等可能已过期的条目仍要探测
+        banners: 是否复用开放端口的连接抓取服务横幅，结果写入设备记录的Banners字段
+        banner_timeout: 横幅读取的超时时间（秒）
+        banner_bytes: 每个端口最多读取的字节数
+        banner_hellos: 是否对HTTP/SSH/SMB端口发送协议握手；关闭时只读取服务端主动发送的数据
     Returns:
-        dict: 端口扫描结果字典 {port: is_open}
+        list: 活跃设备列表；show_table为False时结果只写入文件，返回空列表
     """
-    results = {}
-    for port in ports:
-        for attempt in range(retries + 1):
-            try:
-                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                    s.settimeout(timeout)
-                    result = s.connect_ex((str(ip), port)) == 0
-                    if result or attempt == retries:
-                        results[port] = result
-                        logger.debug(f"端口扫描 {ip}:{port} - {'开放' if result else '关闭'}")
-                        break
-            except Exception as e:
-                if attempt == retries:
-                    logger.debug(f"端口扫描异常 {ip}:{port} - {str(e)}")
-                    results[port] = False
-    return results
+    networks = parse_targets(targets, ranges_file)
+    total_ips = count_hosts(networks)
+    logger.info(f"开始扫描{len(networks)}个网段共{total_ips}个地址 (并发数: {concurrency}, 目标端口: {ports})")
+    if rescan and not state_file:
+        raise ValueError("差异扫描需要指定扫描状态库 state_file")
+    if rescan and ((output and not output.endswith(".jsonl")) or output_format not in (None, "jsonl")):
+        # 变化记录的字段与设备记录不同，只能写成JSONL，不能让.csv文件里装着JSON
+        raise ValueError(f"差异扫描只输出JSONL，输出文件需以.jsonl结尾: {output}")
+    state = ScanState(state_file) if state_file else None
+    known_live = []
+    neighbor_ips, confirmed = neighbor_hosts(networks) if neighbors else ([], [])
+    if neighbor_ips:
+        logger.info(f"邻居表中有{len(neighbor_ips)}台主机在扫描范围内，优先扫描；"
+                    f"其中{len(confirmed)}台近期确认可达，跳过存活探测")
+    # 多进程分片依赖各进程产生相同的随机序列，因此由父进程统一选定种子
+    seed = random.randrange(2 ** 32) if shuffle else None
+    if rescan:
+        known_live = state.live_hosts(networks)
+        logger.info(f"差异扫描: 上次在线{len(known_live)}台主机，其余地址抽样比例{sample_rate}")
+        known_live = sorted(set(known_live) | set(neighbor_ips))
+        total_ips = len(known_live) + int((total_ips - len(known_live)) * sample_rate)
+        network_range = rescan_addresses(networks, known_live, sample_rate=sample_rate, shuffle=shuffle, seed=seed)
+    elif neighbor_ips:
+        network_range = rescan_addresses(networks, neighbor_ips, sample_rate=1.0, shuffle=shuffle, seed=seed)
+    else:
+        network_range = iter_addresses(networks, shuffle=shuffle, seed=seed)
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    if rescan:
+        output = output or f"network_changes_{timestamp}.jsonl"
+        sink = JsonlSink(output, flush_every=flush_every, flush_interval=flush_interval)
+    else:
+        output = output or f"network_scan_{timestamp}.csv"
+        sink = open_sink(output, ports, output_format, banners=banners, flush_every=flush_every,
+                         flush_interval=flush_interval)
+    devices = []
+    stats_file = stats_file or f"network_stats_{timestamp}.json"
 
-def worker_ip_scan(queue, total_ips, ports=[445]):
-    """多线程任务：Ping IP并记录活跃设备"""
-    while not queue.empty():
-        ip = queue.get()
-        if ping_ip(ip):
-            hostname = get_hostname(ip)
-            port_results = scan_port(ip, ports=ports)
-            with PRINT_LOCK:
-                ACTIVE_DEVICES.append({
-                    "IP": str(ip),
-                    "Hostname": hostname,
-                    "Ports": port_results
-                })
-                logger.info(f"发现活跃设备: IP={ip}, 主机名={hostname}, 端口状态={port_results}")
-                # 显示扫描进度
-                completed = total_ips - queue.qsize()
-                progress = (completed / total_ips) * 100
-                print(f"\r扫描进度: {progress:.1f}% ({completed}/{total_ips})", end="")
-        queue.task_done()
+    def record_changes(changes):
+        for change in changes:
+            logger.info(f"状态变化: {change}")
+            if rescan:
+                sink.write(change)
 
-def scan_network(threads=50, ports=[445, 80, 22, 3389]):
-    """主扫描函数
-    Args:
-        threads: 扫描线程数
-        ports: 要扫描的端口列表，默认包含常用服务端口
-    """
-    logger.info(f"开始扫描本地网络 (线程数: {threads}, 目标端口: {ports})")
-    ip_queue = Queue()
-    network_range = list(get_network_range())
-    total_ips = len(network_range)
+    def on_result(device):
+        if state:
+            record_changes(state.update_host(device))
+        if not rescan:
+            sink.write(device)
+        if show_table:
+            devices.append(device)
 
-    # 填充IP队列
-    logger.info("正在准备IP地址队列...")
-    for ip in network_range:
-        ip_queue.put(ip)
+    def on_dead(ip):
+        if state:
+            record_changes(state.mark_dead(ip))
 
-    # 启动多线程扫描
-    logger.info(f"正在启动{threads}个扫描线程...")
-    for _ in range(threads):
-        threading.Thread(target=worker_ip_scan, args=(ip_queue, total_ips, ports), daemon=True).start()
+    banner = BannerGrabber(banner_timeout, banner_bytes, banner_hellos) if banners else None
+    scanner = Scanner(
+        ports=ports, concurrency=concurrency, timeout=timeout, method=method, adaptive=adaptive,
+        rate=rate, subnet_rate=subnet_rate, rate_adapt=rate_adapt, dns_cache=dns_cache, dns_workers=dns_workers,
+        on_result=on_result, on_dead=on_dead, keep_results=False, banner=banner, show_progress=True,
+        stats_interval=stats_interval
+    )
 
-    # 等待所有任务完成
-    ip_queue.join()
-    logger.info("网络扫描完成")
+    subnet_report = {}
+    try:
+        if workers > 1:
+            options = {
+                "ports": ports, "concurrency": concurrency, "timeout": timeout, "method": method,
+                "shuffle": shuffle, "seed": seed, "adaptive": adaptive,
+                "dns_cache": dns_cache, "dns_workers": dns_workers,
+                "rescan": rescan, "known_live": known_live, "sample_rate": sample_rate, "neighbors": neighbor_ips,
+                "confirmed": confirmed,
+                # 只有状态库中记录过的主机才需要把"未响应"回传给父进程
+                "watch": set(state.known_hosts(networks)) if state else set(),
+                "rate": rate, "subnet_rate": subnet_rate, "rate_adapt": rate_adapt,
+                "stats_interval": stats_interval, "log_level": logger.getEffectiveLevel(), "banner": banner,
+            }
+
+            def on_shard_result(device):
+                scanner.resolver.put(device["IP"], device["Hostname"])
+                on_result(device)
+
+            subnet_report = run_shards(workers, networks, options, on_shard_result, on_dead, scanner.stats)
+        else:
+            scanner.scan(ips=network_range, total=total_ips, known_live=confirmed)
+            if scanner.pacer and scanner.pacer.rate:
+                logger.info(f"结束时探测速率: {scanner.pacer.rate:.0f}pps")
+            subnet_report = scanner.report()
+        logger.info("网络扫描完成")
+    finally:
+        scanner.close()
+        if state:
+            state.close()
+        sink.close()
+        logger.info(f"扫描结果已保存到文件: {output} (共{sink.count}条)")
+        save_stats(stats_file, scanner.stats, {
+            "config": {
+                "targets": [str(network) for network in networks], "ports": ports, "concurrency": concurrency,
+                "workers": workers, "timeout": timeout, "adaptive": adaptive, "method": method,
+                "rate": rate, "subnet_rate": subnet_rate, "neighbors": len(neighbor_ips),
+            },
+            "final_rate_pps": round(scanner.pacer.rate, 1) if scanner.pacer and scanner.pacer.rate else None,
+            "subnets": subnet_report,
+        })
 
     # 打印结果
-    active_count = len(ACTIVE_DEVICES)
-    logger.info(f"发现{active_count}个活跃设备")
+    if rescan:
+        logger.info(f"发现{sink.count}处状态变化")
+    else:
+        logger.info(f"发现{sink.count}个活跃设备")
+    if subnet_report:
+        print("\n各子网RTT估计与超时:")
+        for subnet, stats in subnet_report.items():
+            print(f"{subnet:<18} | SRTT {stats['srtt_ms']}ms | RTTVAR {stats['rttvar_ms']}ms | "
+                  f"超时 {stats['timeout_ms']}ms | 重试 {stats['retries_recovered']}/{stats['retries']}")
+        logger.info(f"子网超时估计: {json.dumps(subnet_report, ensure_ascii=False)}")
+    if not show_table:
+        return devices
     print("-" * 60)
     print(f"\n{'IP':<15} | {'Hostname':<25} | 端口状态")
     print("-" * 60)
-    for device in sorted(ACTIVE_DEVICES, key=lambda x: ipaddress.ip_address(x["IP"])):
-        port_status = ", ".join([f"Port {port}: {'开放' if status else '关闭'}" 
-                                for port, status in device['Ports'].items()])
+    for device in sorted(devices, key=lambda x: ipaddress.ip_address(x["IP"])):
+        banner_of = device.get("Banners", {})
+        port_status = ", ".join([f"Port {port}: {'开放' if status else '关闭'}" +
+                                 (f" ({banner_of[port]})" if port in banner_of else "")
+                                 for port, status in device['Ports'].items()])
         print(f"{device['IP']:<15} | {device['Hostname']:<25} | {port_status}")
+    return devices
 
-    # 自动保存扫描结果
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    csv_file = f"network_scan_{timestamp}.csv"
-    try:
-        with open(csv_file, "w", encoding='utf-8') as f:
-            # 写入CSV头部
-            ports_header = ",".join([f"Port_{port}" for port in ports])
-            f.write(f"IP,Hostname,{ports_header}\n")
-            # 写入设备数据
-            for device in ACTIVE_DEVICES:
-                port_values = ",".join([str(device['Ports'].get(port, False)) for port in ports])
-                f.write(f"{device['IP']},{device['Hostname']},{port_values}\n")
-        logger.info(f"扫描结果已保存到文件: {csv_file}")
-    except Exception as e:
-        logger.error(f"保存CSV文件失败: {str(e)}")
+def parse_args():
+    import argparse
+    parser = argparse.ArgumentParser(description="局域网设备扫描")
+    parser.add_argument("-c", "--concurrency", type=int, default=256, help="同时探测的主机数上限（每个进程）")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="扫描进程数，大范围扫描时按CPU核数设置")
+    parser.add_argument("-p", "--ports", default="445,80,22,3389", help="要扫描的端口，逗号分隔")
+    parser.add_argument("-t", "--timeout", type=float, default=1, help="初始探测超时时间（秒）")
+    parser.add_argument("--state", help="SQLite扫描状态库路径")
+    parser.add_argument("--rescan", action="store_true", help="差异扫描：优先探测上次在线的主机，只输出变化")
+    parser.add_argument("--sample-rate", type=float, default=0.05, help="差异扫描时对其余地址的抽样比例")
+    parser.add_argument("-r", "--rate", type=float, help="全局探测速率上限（每秒探测包数），默认不限速")
+    parser.add_argument("--subnet-rate", type=float, help="每个/24子网的探测速率上限，可单独使用")
+    parser.add_argument("--no-rate-adapt", action="store_true", help="超时比例上升时不自动降低探测速率")
+    parser.add_argument("--stats-interval", type=float, default=5, help="周期性输出统计的间隔（秒），0表示不输出")
+    parser.add_argument("--stats-file", help="JSON统计文件，默认 network_stats_<时间戳>.json")
+    parser.add_argument("--fixed-timeout", action="store_true", help="使用固定超时，不根据RTT自适应调整")
+    parser.add_argument("-b", "--banners", action="store_true", help="抓取开放端口的服务横幅")
+    parser.add_argument("--banner-timeout", type=float, default=0.5, help="横幅读取超时时间（秒）")
+    parser.add_argument("--banner-bytes", type=int, default=512, help="每个端口最多读取的横幅字节数")
+    parser.add_argument("--no-hellos", action="store_true", help="不发送HTTP/SSH/SMB握手，只读取服务端主动发送的数据")
+    parser.add_argument("--monitor", action="store_true", help="持续监控模式：按主机自适应间隔复查存活，输出上下线事件")
+    parser.add_argument("--min-interval", type=float, default=30, help="监控模式下的最小复查间隔（秒）")
+    parser.add_argument("--max-interval", type=float, default=900, help="监控模式下稳定主机的最大复查间隔（秒）")
+    parser.add_argument("--down-after", type=int, default=2, help="监控模式下连续多少次无响应判定下线")
+    parser.add_argument("--sweep-interval", type=float, default=3600, help="监控模式下发现扫描的间隔（秒）")
+    parser.add_argument("--no-neighbors", action="store_true", help="不读取内核邻居表（默认先扫描邻居表中的主机，近期确认可达的跳过存活探测）")
+    parser.add_argument("-m", "--method", choices=["auto", "icmp", "tcp"], default="auto", help="存活探测方式")
+    parser.add_argument("targets", nargs="*", help="要扫描的CIDR或IP，默认为本机所在的/24网段")
+    parser.add_argument("-f", "--ranges-file", help="范围文件，每行一个CIDR")
+    parser.add_argument("--shuffle", action="store_true", help="随机化扫描顺序")
+    parser.add_argument("-o", "--output", help="结果文件路径，默认 network_scan_<时间戳>.csv")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="结果文件格式，默认按扩展名推断")
+    parser.add_argument("--flush-every", type=int, default=100, help="累计多少条记录刷新一次文件")
+    parser.add_argument("--flush-interval", type=float, default=1.0, help="记录最多缓冲多少秒")
+    parser.add_argument("--no-table", action="store_true", help="结束时不打印结果表（不在内存中保留结果）")
+    parser.add_argument("--dns-cache", default="dns_cache.json", help="反向DNS缓存文件，传空字符串表示不持久化")
+    parser.add_argument("--dns-workers", type=int, default=16, help="反向DNS解析线程数")
+    args = parser.parse_args()
+    if args.rescan and ((args.output and not args.output.endswith(".jsonl")) or args.format == "csv"):
+        parser.error("--rescan 只输出JSONL变化记录，-o 需以.jsonl结尾且不能指定 --format csv")
+    return args
 
 
 if __name__ == "__main__":
-    scan_network()
\ No newline at end of file
+    args = parse_args()
+    setup_logging()
+    if args.monitor:
+        monitor_network(
+            targets=args.targets,
+            ranges_file=args.ranges_file,
+            output=args.output,
+            flush_interval=args.flush_interval,
+            min_interval=args.min_interval,
+            max_interval=args.max_interval,
+            down_after=args.down_after,
+            sweep_interval=args.sweep_interval,
+            stats_interval=args.stats_interval,
+            rate=args.rate,
+            subnet_rate=args.subnet_rate,
+            rate_adapt=not args.no_rate_adapt,
+            ports=[int(p) for p in args.ports.split(",") if p],
+            concurrency=args.concurrency,
+            timeout=args.timeout,
+            method=args.method,
+            adaptive=not args.fixed_timeout,
+            dns_cache=args.dns_cache or None,
+            dns_workers=args.dns_workers
+        )
+    else:
+        scan_network(
+            concurrency=args.concurrency,
+            ports=[int(p) for p in args.ports.split(",") if p],
+            timeout=args.timeout,
+            method=args.method,
+            targets=args.targets,
+            ranges_file=args.ranges_file,
+            shuffle=args.shuffle,
+            output=args.output,
+            output_format=args.format,
+            flush_every=args.flush_every,
+            flush_interval=args.flush_interval,
+            show_table=not args.no_table,
+            dns_cache=args.dns_cache or None,
+            dns_workers=args.dns_workers,
+            adaptive=not args.fixed_timeout,
+            state_file=args.state,
+            rescan=args.rescan,
+            sample_rate=args.sample_rate,
+            workers=args.workers,
+            rate=args.rate,
+            subnet_rate=args.subnet_rate,
+            rate_adapt=not args.no_rate_adapt,
+            stats_interval=args.stats_interval,
+            stats_file=args.stats_file,
+            neighbors=not args.no_neighbors,
+            banners=args.banners,
+            banner_timeout=args.banner_timeout,
+            banner_bytes=args.banner_bytes,
+            banner_hellos=not args.no_hellos
+        )
@@ -2,10 +2,11 @@ import os
 import json
 import requests
 import zipfile
-import hashlib
 from urllib.parse import unquote
 import time
 
+from hashing import file_digests
+
 # 恶意软件列表
 malware_list = [
     "All.ElectroRAT",
@@ -307,19 +308,6 @@ def get_password(password_url):
         return "infected"  # 默认密码
 
 
-def calculate_md5(file_path):
-    """计算文件的MD5哈希值"""
-    try:
-        hash_md5 = hashlib.md5()
-        with open(file_path, "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                hash_md5.update(chunk)
-        return hash_md5.hexdigest()
-    except Exception as e:
-        print(f"计算MD5失败: {e}")
-        return None
-
-
 def extract_zip(zip_path, extract_to, password=None):
     """解压ZIP文件"""
     try:
@@ -385,19 +373,19 @@ def process_malware_sample(malware_name, base_dir="malware_samples"):
 
         result["extraction_success"] = True
 
-        # 4. 计算解压文件的MD5
-        print(f"  计算MD5...")
+        # 4. 计算解压文件的摘要（MD5/SHA-1/SHA-256/xxh64，一次读取）
+        print(f"  计算哈希...")
         extracted_files = []
         for root, dirs, files in os.walk(extract_path):
             for file in files:
                 file_path = os.path.join(root, file)
                 if os.path.isfile(file_path):
-                    md5 = calculate_md5(file_path)
-                    if md5:
+                    digests = file_digests(file_path)
+                    if digests:
                         extracted_files.append({
                             "filename": file,
                             "path": file_path,
-                            "md5": md5
+                            **digests
                         })
 
         if extracted_files:
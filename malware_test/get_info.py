@@ -1,94 +1,274 @@
 import os
-import hashlib
+import sys
 import json
+import time
+import random
+import argparse
+from functools import partial
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
+from hashing import file_digests, HashCache
 
-def calculate_file_hash(file_path, hash_algorithm='md5'):
-    """计算文件的哈希值"""
-    hash_obj = hashlib.md5() if hash_algorithm == 'md5' else hashlib.sha256()
 
+def is_rotational(path):
+    """判断path所在的磁盘是否为机械盘（仅Linux，通过 /sys/dev/block 查询；其他系统返回False）"""
     try:
-        with open(file_path, 'rb') as f:
-            # 分块读取大文件，避免内存问题
-            for chunk in iter(lambda: f.read(4096), b""):
-                hash_obj.update(chunk)
-        return hash_obj.hexdigest()
-    except Exception as e:
-        print(f"计算文件 {file_path} 哈希值时出错: {e}")
-        return None
+        dev = os.stat(path).st_dev
+        base = f"/sys/dev/block/{os.major(dev)}:{os.minor(dev)}"
+        # 分区没有自己的queue目录，要看所属的整块磁盘
+        for candidate in (base, os.path.join(base, "..")):
+            flag = os.path.join(candidate, "queue", "rotational")
+            if os.path.exists(flag):
+                with open(flag) as f:
+                    return f.read().strip() == "1"
+    except (OSError, AttributeError):
+        pass
+    return False
+
+
+def default_workers(path):
+    """按磁盘类型决定哈希线程数：机械盘并发读会来回寻道，只用2个线程；SSD/NVMe或无法判断时按CPU核数"""
+    if is_rotational(path):
+        return 2
+    return min(32, (os.cpu_count() or 4) * 2)
 
 
-def get_file_size(file_path):
-    """获取文件大小（字节）"""
+def scan_dir(p1, path):
+    """扫描单个目录，返回 (文件列表, 子目录列表)，文件为 (子文件夹名, 文件路径, 大小, 缓存键)
+    大小和缓存键 (大小, mtime_ns, inode) 取自DirEntry的stat结果；Windows上DirEntry自带这些信息，不需要额外的系统调用，
+    Linux上每个文件一次stat（原来os.path.getsize和缓存查询各一次）。与os.walk一致，不进入指向目录的符号链接
+    """
+    files, subdirs = [], []
     try:
-        return os.path.getsize(file_path)
-    except Exception as e:
-        print(f"获取文件 {file_path} 大小时出错: {e}")
-        return 0
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    elif entry.is_file():
+                        st = entry.stat()
+                        # Windows上DirEntry.stat()的st_ino恒为0，要单独取
+                        key = (st.st_size, st.st_mtime_ns, st.st_ino or entry.inode())
+                        files.append((p1, entry.path, st.st_size, key))
+                except OSError as e:
+                    print(f"获取文件 {entry.path} 信息时出错: {e}")
+    except OSError as e:
+        print(f"读取目录 {path} 时出错: {e}")
+    return files, subdirs
+
+
+def walk_files(current_dir, workers):
+    """用workers个线程并行扫描current_dir下各子文件夹的目录树，产出scan_dir返回的文件
+    按目录提交顺序产出，结果与线程调度无关；只处理子文件夹中的文件，current_dir下的文件忽略
+    """
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="walk") as executor:
+        pending = deque()
+        with os.scandir(current_dir) as it:
+            for entry in it:
+                # 只处理子文件夹，子文件夹名字作为p1
+                if entry.is_dir():
+                    pending.append((entry.name, executor.submit(scan_dir, entry.name, entry.path)))
+        while pending:
+            p1, future = pending.popleft()
+            files, subdirs = future.result()
+            for path in subdirs:
+                pending.append((p1, executor.submit(scan_dir, p1, path)))
+            yield from files
+
+
+def hash_file(p1, file_path, size, cached=None, algorithms=None, extra_digests=False):
+    """哈希线程中处理单个文件，返回 (结果对象, 文件路径, 新算出的摘要)，出错返回None
+    cached为缓存中的摘要时不再读文件，此时新算出的摘要为None；algorithms为要计算的摘要，默认全部
+    结果对象固定为 hash/size/threat/type 四个字段（remake.py的xm_hash按全部字段计算），
+    extra_digests为True时才把SHA-1、SHA-256、xxh64附在后面
+    """
+    # 一次读取计算全部摘要
+    digests = cached or file_digests(file_path, algorithms)
+    if digests is None:
+        return None
+
+    # 构建结果对象，hash为MD5
+    file_info = {
+        "hash": digests["md5"],
+        "size": size,
+        "threat": f"{p1}.{p1}.test",
+        "type": "file"
+    }
+    if extra_digests:
+        file_info.update((name, value) for name, value in digests.items() if name != "md5")
+    return file_info, file_path, None if cached else digests
+
+
+def parallel_map(func, jobs, workers):
+    """用线程池执行func(*job)，按提交顺序产出结果；在途任务数有上限，不会一次性提交全部文件"""
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hash") as executor:
+        pending = deque()
+        for job in jobs:
+            pending.append(executor.submit(func, *job))
+            if len(pending) >= workers * 4:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
 
 
-def process_directory(current_dir):
-    result_list = []
+class JsonlWriter:
+    """把结果对象逐行写成JSONL，攒够batch_size条写一次并flush；程序中途崩溃最多丢失最后一批"""
 
-    print(f"开始处理目录: {current_dir}")
+    def __init__(self, path, batch_size=1000):
+        self.path = path
+        self.file = open(path, 'w', encoding='utf-8')
+        self.batch_size = batch_size
+        self.batch = []
+        self.count = 0
 
-    # 遍历当前文件夹下的所有子文件夹
-    for item in os.listdir(current_dir):
-        item_path = os.path.join(current_dir, item)
+    def write(self, record):
+        self.batch.append(json.dumps(record, ensure_ascii=False) + "\n")
+        self.count += 1
+        if len(self.batch) >= self.batch_size:
+            self.flush()
 
-        # 只处理子文件夹，忽略文件
-        if os.path.isdir(item_path):
-            p1 = item  # 子文件夹名字作为p1
+    def flush(self):
+        if self.batch:
+            self.file.write("".join(self.batch))
+            self.batch.clear()
+        self.file.flush()
 
-            print(f"处理子文件夹: {p1}")
+    def close(self):
+        self.flush()
+        self.file.close()
 
-            # 遍历子文件夹下的所有文件
-            for root, dirs, files in os.walk(item_path):
-                for file in files:
-                    file_path = os.path.join(root, file)
+    def __enter__(self):
+        return self
 
-                    # 计算文件哈希值
-                    file_hash = calculate_file_hash(file_path)
+    def __exit__(self, *exc):
+        self.close()
 
-                    if file_hash is not None:
-                        # 获取文件大小
-                        file_size = get_file_size(file_path)
 
-                        # 构建结果对象
-                        file_info = {
-                            "hash": file_hash,
-                            "size": file_size,
-                            "threat": f"{p1}.{p1}.test",
-                            "type": "file"
-                        }
+class Progress:
+    """在同一行刷新处理进度，最多每interval秒输出一次"""
 
-                        result_list.append(file_info)
-                        print(f"处理文件: {file_path} -> 哈希: {file_hash}")
+    def __init__(self, interval=0.5, stream=sys.stderr):
+        self.interval = interval
+        self.stream = stream
+        self.start = time.monotonic()
+        self.next_time = self.start
+        self.files = 0
+        self.bytes = 0
 
-    return result_list
+    def update(self, size):
+        self.files += 1
+        self.bytes += size
+        now = time.monotonic()
+        if now >= self.next_time:
+            self.next_time = now + self.interval
+            self.show(now)
+
+    def show(self, now):
+        elapsed = max(now - self.start, 1e-9)
+        print(f"\r已处理 {self.files} 个文件，{self.bytes / 1048576:,.1f} MB，"
+              f"{self.files / elapsed:,.0f} 个/s，{self.bytes / 1048576 / elapsed:,.1f} MB/s",
+              end="", file=self.stream, flush=True)
+
+    def finish(self):
+        self.show(time.monotonic())
+        print(file=self.stream)
+
+
+def process_directory(current_dir, workers=None, cache=None, verify=0.0, on_record=None, extra_digests=False):
+    """处理样本目录，每得到一个结果对象就调用on_record(结果对象)，返回结果总数
+    Args:
+        cache: HashCache，文件的大小、mtime_ns、inode与缓存一致时直接使用缓存的摘要
+        verify: 命中缓存的文件中重新计算并与缓存核对的比例（0~1），用于发现过期的缓存
+        extra_digests: 结果对象中是否附带SHA-1、SHA-256、xxh64
+    """
+    count = 0
+    progress = Progress()
+    workers = workers or default_workers(current_dir)
+    stats = dict.fromkeys(("cached", "hashed", "verified", "stale"), 0)
+    keys_of = {}  # 文件路径 -> 扫描目录时的缓存键，哈希完成后写缓存用
+    expected = {}  # 文件路径 -> 抽中校验的缓存摘要
+
+    print(f"开始处理目录: {current_dir} (哈希线程数: {workers})")
+
+    def jobs():
+        for p1, file_path, size, key in walk_files(current_dir, workers):
+            if cache is None:
+                yield p1, file_path, size
+                continue
+            cached = cache.lookup(file_path, key)
+            if cached is not None and verify and random.random() < verify:
+                expected[file_path] = cached
+                cached = None
+            if cached is None:
+                keys_of[file_path] = key
+            yield p1, file_path, size, cached
+
+    # 缓存里要存全部摘要；既不用缓存也不输出额外摘要时只算MD5
+    algorithms = None if cache is not None or extra_digests else ("md5",)
+    worker = partial(hash_file, algorithms=algorithms, extra_digests=extra_digests)
+    for result in parallel_map(worker, jobs(), workers):
+        if result is None:
+            continue
+        file_info, file_path, digests = result
+        if cache is not None:
+            key = keys_of.pop(file_path, None)
+            if digests is None:
+                stats["cached"] += 1
+            else:
+                stats["hashed"] += 1
+                cached = expected.pop(file_path, None)
+                if cached is not None:
+                    stats["verified"] += 1
+                    if cached != digests:
+                        stats["stale"] += 1
+                        print(f"缓存已过期: {file_path}")
+                if key is not None:
+                    cache.store(file_path, key, digests)
+        count += 1
+        if on_record:
+            on_record(file_info)
+        progress.update(file_info["size"])
+
+    progress.finish()
+    if cache is not None:
+        cache.commit()
+        print(f"缓存命中 {stats['cached']} 个，重新计算 {stats['hashed']} 个，"
+              f"抽样校验 {stats['verified']} 个，其中过期 {stats['stale']} 个")
+    return count
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="计算样本目录中文件的哈希值")
+    parser.add_argument("directory", nargs="?", default=r"E:\Downloads\malwares", help="样本根目录，其下每个子文件夹为一类")
+    parser.add_argument("-o", "--output", default="file_analysis_results.jsonl", help="结果文件（JSONL，每行一个结果对象）")
+    parser.add_argument("-w", "--workers", type=int, help="哈希线程数，默认按磁盘类型和CPU核数决定")
+    parser.add_argument("--cache", default="hash_cache.db", help="摘要缓存数据库（SQLite）")
+    parser.add_argument("--no-cache", action="store_true", help="不使用缓存，全部重新计算")
+    parser.add_argument("--verify", type=float, default=0.0, metavar="RATIO",
+                        help="抽取命中缓存文件中的这一比例重新计算，核对缓存是否过期，如0.01")
+    parser.add_argument("--extra-digests", action="store_true",
+                        help="结果中附带sha1、sha256、xxh64字段（默认只有hash/size/threat/type）")
+    return parser.parse_args()
 
 
 def main():
     """主函数"""
+    args = parse_args()
     try:
-        # 处理目录并获取结果
-        results = process_directory("E:\Downloads\malwares")
+        # 处理目录，结果边算边写入JSONL文件
+        with JsonlWriter(args.output) as writer:
+            if args.no_cache:
+                count = process_directory(args.directory, args.workers, on_record=writer.write,
+                                          extra_digests=args.extra_digests)
+            else:
+                with HashCache(args.cache) as cache:
+                    count = process_directory(args.directory, args.workers, cache, args.verify, writer.write,
+                                              args.extra_digests)
 
         # 输出统计信息
-        print(f"\n处理完成！共找到 {len(results)} 个文件")
-
-        # 保存为JSON文件
-        output_file = "file_analysis_results.json"
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(results, f, indent=2, ensure_ascii=False)
-
-        print(f"结果已保存到: {output_file}")
-
-        # 显示前几个结果作为示例
-        if results:
-            print("\n前5个结果示例:")
-            for i, result in enumerate(results):
-                print(f"{i + 1}. {result}")
+        print(f"\n处理完成！共找到 {count} 个文件")
+        print(f"结果已保存到: {args.output}")
 
     except Exception as e:
         print(f"程序执行出错: {e}")
@@ -0,0 +1,320 @@
+"""已知恶意样本MD5索引：把结果文件中的全部MD5编译成紧凑的磁盘索引，扫描主机文件时逐个查表
+
+索引文件布局（小端）:
+    文件头    HEADER
+    分桶表    65537个uint32，按MD5前2字节分桶，第i桶的摘要下标范围为 [桶表[i], 桶表[i+1])
+    摘要数组  count个16字节MD5，升序排列
+    标签编号  count个uint32，对应摘要的威胁标签在标签表中的下标
+    Bloom过滤器  bloom_bits位（可选，0表示没有）
+    标签表    JSON字符串列表
+索引以mmap方式打开，不把摘要读进内存。查询先看分桶表，桶为空（绝大多数不命中的情况）直接返回；
+桶非空时再过Bloom过滤器，最后在桶内二分查找，桶内通常只有0~1个摘要。
+Bloom过滤器在索引远大于内存、摘要数组需要从磁盘换入时才有意义，小索引不加反而更快。
+
+用法:
+    python hash_index.py build [来源文件...] [-o known_hashes.idx] [--bloom 10]
+    python hash_index.py scan 目录 [-i known_hashes.idx] [-o matches.jsonl]
+    python hash_index.py bench [-i known_hashes.idx] [-n 1000000]
+"""
+import os
+import sys
+import json
+import mmap
+import time
+import array
+import struct
+import argparse
+
+from hashing import file_digests
+from get_info import scan_dir, walk_files, parallel_map, default_workers, JsonlWriter, Progress
+
+MAGIC = b"MD5IDX\x00\x01"
+# 魔数、摘要数、Bloom位数、Bloom哈希个数、标签表长度（字节）
+HEADER = struct.Struct("<8sQQII")
+BUCKETS = 65536
+DIGEST_SIZE = 16
+DEFAULT_INDEX = "known_hashes.idx"
+DEFAULT_SOURCES = ("malware_analysis_results.json", "file_analysis_results.json", "file_analysis_results.jsonl")
+
+
+def load_known_hashes(path):
+    """从结果文件读出 (MD5十六进制, 威胁标签)
+    支持三种格式: download.py的 {"summary", "results"}、get_info.py的结果列表（.json）或逐行结果对象（.jsonl）
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.endswith('.jsonl'):
+            records = (json.loads(line) for line in f if line.strip())
+            for record in records:
+                yield record["hash"], record["threat"]
+            return
+        data = json.load(f)
+
+    if isinstance(data, dict):
+        for result in data.get("results", []):
+            name = result["name"]
+            if result.get("md5_hash"):
+                yield result["md5_hash"], name
+            for extracted in result.get("extracted_files") or []:
+                yield extracted["md5"], name
+    else:
+        for record in data:
+            yield record["hash"], record["threat"]
+
+
+def bloom_positions(digest, bits, k):
+    """用MD5自身的两半做双重哈希，得到k个位位置；MD5分布均匀，不需要再计算别的哈希"""
+    h1 = int.from_bytes(digest[:8], "little")
+    h2 = int.from_bytes(digest[8:], "little") | 1
+    return [(h1 + i * h2) % bits for i in range(k)]
+
+
+def build_index(sources, output, bloom_bits_per_key=0):
+    """把sources中的MD5去重排序后写成索引文件，同一MD5有多个标签时用逗号合并，返回摘要数"""
+    labels_of = {}
+    for source in sources:
+        for md5, threat in load_known_hashes(source):
+            try:
+                digest = bytes.fromhex(md5)
+            except (TypeError, ValueError):
+                continue
+            if len(digest) != DIGEST_SIZE:
+                continue
+            labels = labels_of.setdefault(digest, [])
+            if threat not in labels:
+                labels.append(threat)
+
+    digests = sorted(labels_of)
+    label_table = {}
+    label_ids = array.array("I", (label_table.setdefault(", ".join(labels_of[d]), len(label_table)) for d in digests))
+
+    buckets = array.array("I", bytes(4 * (BUCKETS + 1)))
+    for digest in digests:
+        buckets[(digest[0] << 8 | digest[1]) + 1] += 1
+    for i in range(BUCKETS):
+        buckets[i + 1] += buckets[i]
+
+    bloom_bits, bloom_k = 0, 0
+    bloom = bytearray()
+    if bloom_bits_per_key and digests:
+        # 位数取8的倍数；k = 每键位数 * ln2 时误判率最低
+        bloom_bits = (len(digests) * bloom_bits_per_key + 7) // 8 * 8
+        bloom_k = max(1, round(bloom_bits_per_key * 0.693))
+        bloom = bytearray(bloom_bits // 8)
+        for digest in digests:
+            for position in bloom_positions(digest, bloom_bits, bloom_k):
+                bloom[position >> 3] |= 1 << (position & 7)
+
+    labels = json.dumps(list(label_table), ensure_ascii=False).encode("utf-8")
+    if sys.byteorder != "little":
+        buckets.byteswap()
+        label_ids.byteswap()
+    tmp_path = output + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(digests), bloom_bits, bloom_k, len(labels)))
+        f.write(buckets.tobytes())
+        f.write(b"".join(digests))
+        f.write(label_ids.tobytes())
+        f.write(bloom)
+        f.write(labels)
+    os.replace(tmp_path, output)
+    return len(digests)
+
+
+class HashIndex:
+    """以mmap方式打开索引文件，lookup(16字节MD5)返回威胁标签，不在索引中返回None"""
+
+    def __init__(self, path=DEFAULT_INDEX):
+        self.file = open(path, "rb")
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self.file.close()
+            raise ValueError(f"{path} 是空文件")
+        magic, self.count, self.bloom_bits, self.bloom_k, labels_size = HEADER.unpack_from(self.map)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{path} 不是MD5索引文件")
+        offset = HEADER.size
+        self.buckets = memoryview(self.map)[offset:offset + 4 * (BUCKETS + 1)].cast("I")
+        offset += 4 * (BUCKETS + 1)
+        self.digests_offset = offset
+        offset += self.count * DIGEST_SIZE
+        self.label_ids = memoryview(self.map)[offset:offset + 4 * self.count].cast("I")
+        offset += 4 * self.count
+        self.bloom = memoryview(self.map)[offset:offset + self.bloom_bits // 8]
+        offset += self.bloom_bits // 8
+        self.labels = json.loads(self.map[offset:offset + labels_size].decode("utf-8"))
+        if sys.byteorder != "little":
+            # 大端机器上分桶表和标签编号需要转换字节序，复制进内存
+            self.buckets = self.swapped(self.buckets)
+            self.label_ids = self.swapped(self.label_ids)
+
+    @staticmethod
+    def swapped(view):
+        values = array.array("I", view.tobytes())
+        values.byteswap()
+        view.release()
+        return values
+
+    def __len__(self):
+        return self.count
+
+    def might_contain(self, digest):
+        """Bloom过滤器判断，False表示一定不在索引中；没有Bloom过滤器时总是True"""
+        if not self.bloom_bits:
+            return True
+        bloom = self.bloom
+        for position in bloom_positions(digest, self.bloom_bits, self.bloom_k):
+            if not bloom[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def find(self, digest):
+        """返回digest在摘要数组中的下标，不存在返回-1"""
+        bucket = digest[0] << 8 | digest[1]
+        lo, hi = self.buckets[bucket], self.buckets[bucket + 1]
+        if lo == hi:
+            return -1
+        if self.bloom_bits and not self.might_contain(digest):
+            return -1
+        data, base = self.map, self.digests_offset
+        while lo < hi:
+            mid = (lo + hi) >> 1
+            start = base + mid * DIGEST_SIZE
+            value = data[start:start + DIGEST_SIZE]
+            if value < digest:
+                lo = mid + 1
+            elif value > digest:
+                hi = mid
+            else:
+                return mid
+        return -1
+
+    def lookup(self, digest):
+        index = self.find(digest)
+        return None if index < 0 else self.labels[self.label_ids[index]]
+
+    def close(self):
+        for view in ("buckets", "label_ids", "bloom"):
+            if isinstance(getattr(self, view, None), memoryview):
+                getattr(self, view).release()
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def iter_scan_files(directory, workers):
+    """产出directory下的全部文件，包括directory直接包含的文件（walk_files只产出子文件夹中的）"""
+    files, _ = scan_dir("", directory)
+    yield from files
+    yield from walk_files(directory, workers)
+
+
+def md5_of(p1, file_path, size, key):
+    """扫描线程中只计算MD5，返回 (文件路径, 大小, 16字节MD5)，出错返回None"""
+    digests = file_digests(file_path, ("md5",))
+    if digests is None:
+        return None
+    return file_path, size, bytes.fromhex(digests["md5"])
+
+
+def scan_directory(index, directory, workers=None, on_match=None):
+    """计算directory下所有文件的MD5并查索引，命中时调用on_match(文件路径, MD5十六进制, 威胁标签)
+    返回 (扫描文件数, 命中数)
+    """
+    workers = workers or default_workers(directory)
+    progress = Progress()
+    scanned = matched = 0
+    for result in parallel_map(md5_of, iter_scan_files(directory, workers), workers):
+        if result is None:
+            continue
+        file_path, size, digest = result
+        scanned += 1
+        threat = index.lookup(digest)
+        if threat is not None:
+            matched += 1
+            if on_match:
+                on_match(file_path, digest.hex(), threat)
+        progress.update(size)
+    progress.finish()
+    return scanned, matched
+
+
+def bench(index, count):
+    """随机查询count次（一半命中、一半不命中），返回每秒查询数"""
+    start = index.digests_offset
+    known = [index.map[start + i * DIGEST_SIZE:start + (i + 1) * DIGEST_SIZE] for i in range(min(index.count, 4096))]
+    unknown = [os.urandom(DIGEST_SIZE) for _ in range(4096)]
+    queries = [known[i % len(known)] if i % 2 and known else unknown[i % len(unknown)] for i in range(count)]
+    lookup = index.lookup
+    start = time.perf_counter()
+    found = sum(1 for digest in queries if lookup(digest) is not None)
+    elapsed = time.perf_counter() - start
+    print(f"{count}次查询，命中{found}次，用时{elapsed:.3f}秒，{count / elapsed:,.0f} 次/s")
+    return count / elapsed
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="已知恶意样本MD5索引")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="从结果文件生成索引")
+    build.add_argument("sources", nargs="*", help="结果文件，默认为当前目录下存在的 " + "、".join(DEFAULT_SOURCES))
+    build.add_argument("-o", "--output", default=DEFAULT_INDEX, help="索引文件")
+    build.add_argument("--bloom", type=int, default=0, metavar="BITS_PER_KEY",
+                       help="在索引前加Bloom过滤器，每个摘要占用的位数（如10，误判率约1%%），默认不加")
+
+    scan = commands.add_parser("scan", help="扫描目录，报告命中索引的文件")
+    scan.add_argument("directory", help="要扫描的目录")
+    scan.add_argument("-i", "--index", default=DEFAULT_INDEX, help="索引文件")
+    scan.add_argument("-w", "--workers", type=int, help="哈希线程数，默认按磁盘类型和CPU核数决定")
+    scan.add_argument("-o", "--output", help="把命中结果写成JSONL文件")
+
+    bench_parser = commands.add_parser("bench", help="测试查询速度")
+    bench_parser.add_argument("-i", "--index", default=DEFAULT_INDEX, help="索引文件")
+    bench_parser.add_argument("-n", "--count", type=int, default=1000000, help="查询次数")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.command == "build":
+        sources = args.sources or [path for path in DEFAULT_SOURCES if os.path.exists(path)]
+        if not sources:
+            sys.exit("没有找到结果文件，请指定来源文件")
+        start = time.monotonic()
+        count = build_index(sources, args.output, args.bloom)
+        print(f"索引已保存到: {args.output}，共 {count} 个MD5，来源: {', '.join(sources)}，"
+              f"用时{time.monotonic() - start:.2f}秒")
+        return
+
+    try:
+        index = HashIndex(args.index)
+    except (OSError, ValueError) as e:
+        sys.exit(f"无法打开索引 {args.index}: {e}，请先运行 build 生成索引")
+    with index:
+        if args.command == "bench":
+            bench(index, args.count)
+            return
+        writer = JsonlWriter(args.output, batch_size=100) if args.output else None
+
+        def on_match(file_path, md5, threat):
+            print(f"\n命中: {file_path} -> {threat} ({md5})")
+            if writer:
+                writer.write({"path": file_path, "hash": md5, "threat": threat})
+
+        try:
+            scanned, matched = scan_directory(index, args.directory, args.workers, on_match)
+        finally:
+            if writer:
+                writer.close()
+        print(f"扫描完成！共 {scanned} 个文件，命中 {matched} 个（索引中有 {len(index)} 个MD5）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""样本文件哈希：一次读取文件，同时计算MD5、SHA-1、SHA-256和xxh64
+
+每读出一块数据就依次交给所有哈希对象，文件只读一遍；get_info.py和download.py都用这里的函数。
+xxh64需要xxhash库（pip install xxhash），未安装时结果中没有xxh64这一项。
+HashCache把算好的摘要按 (路径, 大小, mtime_ns, inode) 存进SQLite，文件没有变化时重跑可以直接取缓存。
+"""
+import os
+import mmap
+import sqlite3
+import hashlib
+import threading
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+# 不超过该大小的文件一次读入；更大的文件用可复用的缓冲区分块读取
+BUFFER_SIZE = 1024 * 1024
+# 超过该大小的文件用mmap映射后按窗口交给各哈希对象，省去逐块read的系统调用和内存复制
+MMAP_THRESHOLD = 64 * 1024 * 1024
+# mmap时每个窗口的大小，窗口内的数据被所有哈希对象处理完再前进，数据始终在CPU缓存/页缓存中
+MMAP_WINDOW = 8 * 1024 * 1024
+
+ALGORITHMS = ("md5", "sha1", "sha256", "xxh64")
+
+# 每个哈希线程自己的读缓冲区
+_local = threading.local()
+
+
+def available_algorithms():
+    """当前环境能计算的摘要算法"""
+    return tuple(name for name in ALGORITHMS if name != "xxh64" or xxhash is not None)
+
+
+def new_hashers(algorithms=None):
+    """创建 {算法名: 哈希对象}，xxhash未安装时跳过xxh64"""
+    hashers = {}
+    for name in algorithms or ALGORITHMS:
+        if name == "xxh64":
+            if xxhash is not None:
+                hashers[name] = xxhash.xxh64()
+        else:
+            hashers[name] = hashlib.new(name)
+    return hashers
+
+
+def _read_buffer():
+    if not hasattr(_local, "buffer"):
+        _local.buffer = bytearray(BUFFER_SIZE)
+        _local.view = memoryview(_local.buffer)
+    return _local.buffer, _local.view
+
+
+def file_digests(file_path, algorithms=None):
+    """读一遍文件，返回 {算法名: 十六进制摘要}，出错返回None
+    hashlib处理大块数据时会释放GIL，多个线程可以同时计算不同文件的摘要
+    """
+    hashers = list(new_hashers(algorithms).items())
+    updates = [hasher.update for _, hasher in hashers]
+
+    try:
+        with open(file_path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size <= BUFFER_SIZE:
+                data = f.read()
+                for update in updates:
+                    update(data)
+            elif size >= MMAP_THRESHOLD:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    if hasattr(mmap, "MADV_SEQUENTIAL"):
+                        mapped.madvise(mmap.MADV_SEQUENTIAL)
+                    view = memoryview(mapped)
+                    try:
+                        for offset in range(0, len(mapped), MMAP_WINDOW):
+                            window = view[offset:offset + MMAP_WINDOW]
+                            for update in updates:
+                                update(window)
+                            window.release()
+                    finally:
+                        view.release()
+            else:
+                buffer, view = _read_buffer()
+                while True:
+                    n = f.readinto(buffer)
+                    if not n:
+                        break
+                    chunk = view[:n]
+                    for update in updates:
+                        update(chunk)
+        return {name: hasher.hexdigest() for name, hasher in hashers}
+    except Exception as e:
+        print(f"计算文件 {file_path} 哈希值时出错: {e}")
+        return None
+
+
+class HashCache:
+    """SQLite摘要缓存，以路径为主键，大小、mtime_ns、inode任一变化即视为未命中
+    只应在一个线程中使用；store的写入攒够commit_every条才提交一次
+    """
+
+    def __init__(self, db_path="hash_cache.db", commit_every=1000):
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        columns = ", ".join(f"{name} TEXT" for name in ALGORITHMS)
+        self.conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS digests (
+                path TEXT PRIMARY KEY,
+                size INTEGER,
+                mtime_ns INTEGER,
+                inode INTEGER,
+                {columns}
+            )
+        """)
+        self.commit_every = commit_every
+        self.uncommitted = 0
+        self.required = set(available_algorithms())
+        self.select_sql = f"SELECT size, mtime_ns, inode, {', '.join(ALGORITHMS)} FROM digests WHERE path = ?"
+        self.insert_sql = (f"INSERT OR REPLACE INTO digests (path, size, mtime_ns, inode, {', '.join(ALGORITHMS)}) "
+                           f"VALUES ({', '.join('?' * (4 + len(ALGORITHMS)))})")
+
+    def lookup(self, path, key):
+        """key为 (大小, mtime_ns, inode)，文件未变化时返回缓存的 {算法名: 摘要}，否则返回None
+        缓存时缺少某个当前可用的算法（如后来才安装xxhash）也算未命中
+        """
+        row = self.conn.execute(self.select_sql, (path,)).fetchone()
+        if row is None or tuple(row[:3]) != tuple(key):
+            return None
+        digests = {name: value for name, value in zip(ALGORITHMS, row[3:]) if value is not None}
+        if not self.required <= digests.keys():
+            return None
+        return digests
+
+    def store(self, path, key, digests):
+        self.conn.execute(self.insert_sql, (path, *key, *(digests.get(name) for name in ALGORITHMS)))
+        self.uncommitted += 1
+        if self.uncommitted >= self.commit_every:
+            self.commit()
+
+    def commit(self):
+        self.conn.commit()
+        self.uncommitted = 0
+
+    def close(self):
+        self.commit()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
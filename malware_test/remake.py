@@ -122,9 +122,11 @@ def sign(dls, extra_excludes=None):
 # 	print(res)
 
 def load_json_data(file_path):
-	"""从JSON文件加载数据"""
+	"""从JSON文件加载数据，.jsonl文件按每行一个对象读成列表"""
 	try:
 		with open(file_path, 'r', encoding='utf-8') as f:
+			if file_path.endswith('.jsonl'):
+				return [json.loads(line) for line in f if line.strip()]
 			data = json.load(f)
 		return data
 	except FileNotFoundError:
@@ -139,7 +141,7 @@ def load_json_data(file_path):
 
 
 if __name__ == "__main__":
-	json_file = "file_analysis_results.json"
+	json_file = "file_analysis_results.jsonl"
 	data = load_json_data(json_file)
 
 	if data:
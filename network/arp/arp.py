@@ -1,10 +1,119 @@
-from scapy.all import *
+"""ARP查询与网段扫描：用报文模板构造ARP请求，从AF_PACKET原始套接字发送（需要root权限，仅支持Linux）
 
-gateway = ""
+网段扫描时由一个发送者按设定速率把整个网段的请求发完，另一个线程在抓包套接字上同时收集应答，
+发完后再等待一个宽限期；应答一到就以 MAC - IP 的形式输出，/22 大约一秒即可扫完。
+"""
+import os
+import sys
+import time
+import socket
+import argparse
+import ipaddress
+import threading
 
-# 发送ARP请求包
-ans, unans = srp(Ether(dst="ff:ff:ff:ff:ff:ff")/ARP(pdst=gateway), timeout=2)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import packet
 
-# 打印响应结果
-for snd, rcv in ans:
-    print(rcv.sprintf("%Ether.src% - %ARP.psrc%"))
\ No newline at end of file
+def arp_query(target, ifname=None, timeout=2):
+    """向target发送一个ARP请求，返回其MAC地址，超时返回None"""
+    ifname = ifname or packet.route_interface(target)
+    src_mac, src_ip = packet.interface_info(ifname)
+    template = packet.ArpRequestTemplate(src_mac, src_ip)
+    with socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(packet.ETH_P_ARP)) as s:
+        s.bind((ifname, 0))
+        s.send(template.patch(int(ipaddress.IPv4Address(target))))
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            s.settimeout(remaining)
+            try:
+                reply = packet.parse_arp_reply(s.recv(2048))
+            except socket.timeout:
+                return None
+            if reply and reply[0] == target:
+                return reply[1]
+
+def arp_sweep(network, ifname=None, rate=2000, wait=0.5, on_reply=None):
+    """向network中的每个地址发送ARP请求，返回 {IP: MAC}
+    Args:
+        network: IPv4Network
+        ifname: 网卡，默认按路由表选择
+        rate: 发送速率上限（每秒请求数），0表示不限速
+        wait: 发送结束后继续接收应答的宽限期（秒）
+        on_reply: 收到网段内地址的首个应答时以(ip, mac)调用，在接收线程中执行
+    """
+    ifname = ifname or packet.route_interface(str(network.network_address))
+    src_mac, src_ip = packet.interface_info(ifname)
+    template = packet.ArpRequestTemplate(src_mac, src_ip)
+    found = {}
+    running = threading.Event()
+
+    receiver = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(packet.ETH_P_ARP))
+    receiver.bind((ifname, 0))
+    receiver.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+    receiver.settimeout(0.1)
+
+    def receive():
+        while running.is_set():
+            try:
+                reply = packet.parse_arp_reply(receiver.recv(2048))
+            except socket.timeout:
+                continue
+            if reply and reply[0] not in found and ipaddress.IPv4Address(reply[0]) in network:
+                found[reply[0]] = reply[1]
+                if on_reply:
+                    on_reply(*reply)
+
+    running.set()
+    thread = threading.Thread(target=receive, name="arp-sniffer", daemon=True)
+    thread.start()
+    try:
+        with socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(packet.ETH_P_ARP)) as sender:
+            sender.bind((ifname, 0))
+            first = int(network.network_address)
+            hosts = range(first, first + network.num_addresses)
+            if network.num_addresses > 2:
+                hosts = hosts[1:-1]  # 跳过网络地址和广播地址
+            start = time.monotonic()
+            for sent, target in enumerate(hosts, 1):
+                packet.send_packet(sender, template.patch(target))
+                packet.pace(start, sent, rate)
+        time.sleep(wait)
+    finally:
+        running.clear()
+        thread.join()
+        receiver.close()
+    return found
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="ARP查询与网段扫描")
+    parser.add_argument("target", nargs="?", help="要查询的IP或要扫描的网段（CIDR），默认为默认网关")
+    parser.add_argument("-i", "--interface", help="网卡，默认按路由表选择")
+    parser.add_argument("-t", "--timeout", type=float, default=2, help="单个IP查询时等待应答的时间（秒）")
+    parser.add_argument("-r", "--rate", type=float, default=2000, help="网段扫描的发送速率上限（每秒请求数）")
+    parser.add_argument("-w", "--wait", type=float, default=0.5, help="网段扫描发送结束后等待应答的时间（秒）")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    target = args.target or packet.default_gateway()
+    if not target:
+        sys.exit("没有默认网关，请指定要查询的IP")
+    network = ipaddress.IPv4Network(target, strict=False)
+    if network.num_addresses > 1:
+        start = time.monotonic()
+        found = arp_sweep(network, args.interface, args.rate, args.wait,
+                          on_reply=lambda ip, mac: print(f"{mac} - {ip}", flush=True))
+        print(f"扫描{network}完成: {len(found)}台主机应答，用时{time.monotonic() - start:.2f}秒")
+        return
+    mac = arp_query(target, args.interface, args.timeout)
+    if mac:
+        print(f"{mac} - {target}")
+    else:
+        print(f"{target} 无应答")
+
+
+if __name__ == "__main__":
+    main()
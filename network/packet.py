@@ -0,0 +1,154 @@
+"""报文模板与网络接口信息
+
+报文的字节只构造一次，放在预分配的bytearray里；之后每发一个报文只改写变化的字段（目的IP、端口、序列号、校验和），
+校验和按改写的字段增量计算，不需要像scapy那样为每个报文创建各层对象再序列化。
+patch返回的是模板缓冲区的memoryview，在下一次patch之前有效，直接交给socket.send/sendto即可。
+"""
+import time
+import errno
+import socket
+import struct
+
+ETH_P_IP = 0x0800
+ETH_P_ARP = 0x0806
+BROADCAST_MAC = b"\xff" * 6
+ARP_REQUEST = 1
+ARP_REPLY = 2
+TCP_SYN = 0x02
+
+# ioctl请求码（linux/sockios.h）
+SIOCGIFADDR = 0x8915
+SIOCGIFHWADDR = 0x8927
+
+def fold(total):
+    """把32位累加和折叠为16位反码和"""
+    total = (total & 0xffff) + (total >> 16)
+    total = (total & 0xffff) + (total >> 16)
+    return total
+
+def word_sum(data):
+    """按16位大端字相加（长度为奇数时末尾补零）"""
+    if len(data) % 2:
+        data = bytes(data) + b"\0"
+    return sum(struct.unpack(f"!{len(data) // 2}H", data))
+
+def checksum(data):
+    """互联网校验和（RFC 1071）"""
+    return ~fold(word_sum(data)) & 0xffff
+
+def mac_to_str(mac):
+    return ":".join(f"{b:02x}" for b in mac)
+
+class PacketTemplate:
+    """报文模板基类：持有预分配的缓冲区及其memoryview，子类负责构造初始字节和实现patch"""
+
+    def __init__(self, data):
+        self.buffer = bytearray(data)
+        self.view = memoryview(self.buffer)
+
+    def __len__(self):
+        return len(self.buffer)
+
+class TcpSynTemplate(PacketTemplate):
+    """IPv4 + TCP SYN报文模板，供IP_HDRINCL原始套接字发送
+    内核会填写IP总长度、标识和IP头校验和，每个报文只需改写目的IP、目的端口、序列号和TCP校验和
+    """
+    IP_DST = struct.Struct("!I")
+    TCP_PATCH = struct.Struct("!HI")  # 目的端口、序列号
+    CHECKSUM = struct.Struct("!H")
+
+    def __init__(self, src_ip, src_port, window=1024, ttl=64):
+        src = socket.inet_aton(src_ip)
+        ip_header = struct.pack("!BBHHHBBH4s4s", 0x45, 0, 40, 0, 0x4000, ttl, socket.IPPROTO_TCP, 0, src, b"\0" * 4)
+        tcp_header = struct.pack("!HHIIBBHHH", src_port, 0, 0, 0, 5 << 4, TCP_SYN, window, 0, 0)
+        super().__init__(ip_header + tcp_header)
+        # 伪首部和TCP首部中固定字段的部分和，可变字段在patch时再加上
+        self.partial_sum = word_sum(src + struct.pack("!BBH", 0, socket.IPPROTO_TCP, len(tcp_header)) + tcp_header)
+
+    def patch(self, dst, port, seq):
+        """dst为整数形式的IPv4地址"""
+        self.IP_DST.pack_into(self.buffer, 16, dst)
+        self.TCP_PATCH.pack_into(self.buffer, 22, port, seq)
+        total = self.partial_sum + (dst >> 16) + (dst & 0xffff) + port + (seq >> 16) + (seq & 0xffff)
+        self.CHECKSUM.pack_into(self.buffer, 36, ~fold(total) & 0xffff)
+        return self.view
+
+class ArpRequestTemplate(PacketTemplate):
+    """以太网广播ARP请求模板，供AF_PACKET原始套接字发送；ARP没有校验和，每个报文只改写目标IP"""
+    TARGET_IP = struct.Struct("!I")
+
+    def __init__(self, src_mac, src_ip):
+        ethernet = BROADCAST_MAC + src_mac + struct.pack("!H", ETH_P_ARP)
+        arp = struct.pack("!HHBBH6s4s6s4s", 1, ETH_P_IP, 6, 4, ARP_REQUEST,
+                          src_mac, socket.inet_aton(src_ip), b"\0" * 6, b"\0" * 4)
+        super().__init__(ethernet + arp)
+
+    def patch(self, target):
+        """target为整数形式的IPv4地址"""
+        self.TARGET_IP.pack_into(self.buffer, 38, target)
+        return self.view
+
+def send_packet(sock, data, address=None):
+    """发送一个报文，发送队列已满（ENOBUFS）时稍等后重试"""
+    while True:
+        try:
+            if address:
+                sock.sendto(data, address)
+            else:
+                sock.send(data)
+            return
+        except OSError as e:
+            if e.errno != errno.ENOBUFS:
+                raise
+            time.sleep(0.001)
+
+def pace(start, sent, rate, batch=64):
+    """发送速率控制：每发送batch个报文检查一次，超前于start + sent / rate的计划时就休眠等待"""
+    if rate and sent % batch == 0:
+        ahead = start + sent / rate - time.monotonic()
+        if ahead > 0:
+            time.sleep(ahead)
+
+def parse_arp_reply(frame):
+    """解析以太网帧中的ARP应答，返回 (发送方IP, 发送方MAC)，不是ARP应答时返回None"""
+    if len(frame) < 42 or frame[12:14] != b"\x08\x06" or struct.unpack_from("!H", frame, 20)[0] != ARP_REPLY:
+        return None
+    return socket.inet_ntoa(frame[28:32]), mac_to_str(frame[22:28])
+
+def interface_info(ifname):
+    """返回网卡的 (MAC地址字节, IPv4地址)，仅支持Linux"""
+    import fcntl
+    request = struct.pack("256s", ifname.encode()[:15])
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        mac = fcntl.ioctl(s.fileno(), SIOCGIFHWADDR, request)[18:24]
+        ip = socket.inet_ntoa(fcntl.ioctl(s.fileno(), SIOCGIFADDR, request)[20:24])
+    return mac, ip
+
+def route_addr(value):
+    """/proc/net/route中的地址是按主机字节序打印的十六进制，转换为整数形式的IPv4地址"""
+    return struct.unpack("!I", struct.pack("<I", int(value, 16)))[0]
+
+def routes():
+    """读取路由表，返回 [(网卡, 目的网络, 掩码, 网关)]，地址均为整数形式"""
+    entries = []
+    with open("/proc/net/route", encoding="ascii") as f:
+        next(f)  # 表头
+        for line in f:
+            fields = line.split()
+            entries.append((fields[0], route_addr(fields[1]), route_addr(fields[7]), route_addr(fields[2])))
+    return entries
+
+def route_interface(dst):
+    """按最长前缀匹配找出发往dst所用的网卡"""
+    dst = struct.unpack("!I", socket.inet_aton(dst))[0]
+    matches = [(mask, ifname) for ifname, dest, mask, _ in routes() if dst & mask == dest]
+    if not matches:
+        raise OSError(f"没有到{socket.inet_ntoa(struct.pack('!I', dst))}的路由")
+    return max(matches)[1]
+
+def default_gateway():
+    """默认路由的网关地址，没有默认路由时返回None"""
+    for _, dest, mask, gateway in routes():
+        if dest == 0 and mask == 0 and gateway:
+            return socket.inet_ntoa(struct.pack("!I", gateway))
+    return None
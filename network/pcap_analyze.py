@@ -0,0 +1,216 @@
+"""离线pcap分析：从扫描时抓的包中重建开放端口表和主机表
+
+文件以mmap方式映射，逐个报文用struct直接在memoryview上解析以太网/IP/TCP/ARP首部，不复制报文数据，
+也不像scapy的rdpcap那样把整个文件读成对象列表；内存中只保留汇总表，多GB的抓包也可以流式处理。
+只支持经典pcap格式，pcapng需要先转换: editcap -F pcap in.pcapng out.pcap
+"""
+import sys
+import mmap
+import json
+import time
+import socket
+import struct
+import argparse
+from datetime import datetime
+
+import packet
+
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+ETH_P_8021Q = 0x8100
+TCP_SYN = 0x02
+TCP_RST = 0x04
+TCP_ACK = 0x10
+
+class PcapReader:
+    """以内存映射方式读取pcap文件，逐个产出 (时间戳, 报文的memoryview)
+    产出的memoryview在迭代到下一个报文时即被释放，需要保留报文内容时请自行bytes()复制
+    """
+    # 魔数 -> (字节序, 时间戳小数部分的单位)
+    MAGIC = {
+        b"\xd4\xc3\xb2\xa1": ("<", 1e-6),
+        b"\xa1\xb2\xc3\xd4": (">", 1e-6),
+        b"\x4d\x3c\xb2\xa1": ("<", 1e-9),
+        b"\xa1\xb2\x3c\x4d": (">", 1e-9),
+    }
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self.file.close()
+            raise ValueError(f"{path} 是空文件")
+        if hasattr(mmap, "MADV_SEQUENTIAL"):
+            self.map.madvise(mmap.MADV_SEQUENTIAL)
+        magic = self.map[:4]
+        if magic not in self.MAGIC:
+            self.close()
+            raise ValueError(f"{path} 不是pcap文件（pcapng请先用 editcap -F pcap 转换）")
+        endian, self.resolution = self.MAGIC[magic]
+        self.record = struct.Struct(endian + "IIII")
+        self.linktype = struct.unpack_from(endian + "I", self.map, 20)[0]
+
+    def __iter__(self):
+        view = memoryview(self.map)
+        record = self.record
+        resolution = self.resolution
+        offset = 24
+        size = len(self.map)
+        try:
+            while offset + 16 <= size:
+                ts_sec, ts_frac, incl_len, _ = record.unpack_from(view, offset)
+                offset += 16
+                frame = view[offset:offset + incl_len]
+                yield ts_sec + ts_frac * resolution, frame
+                frame.release()
+                offset += incl_len
+        finally:
+            view.release()
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class CaptureAnalyzer:
+    """汇总抓包中的扫描结果
+    开放端口以目标回复的SYN-ACK为准，目标回复RST-ACK的端口记为关闭（扫描机内核对SYN-ACK回的是不带ACK的RST，不计入）；
+    主机表记录回复过TCP或发送过ARP的地址，
+    MAC只取自ARP（IP报文的以太网源地址可能是路由器）
+    """
+    IP_ADDRS = struct.Struct("!II")
+    PORTS = struct.Struct("!HH")
+
+    def __init__(self):
+        self.hosts = {}  # 整数IP -> {"mac", "first_seen", "last_seen", "open": 端口集合, "closed": 端口集合}
+        self.counters = dict.fromkeys(("packets", "syn", "syn_ack", "rst", "arp_request", "arp_reply",
+                                       "unsupported"), 0)
+
+    def host(self, ip, ts):
+        host = self.hosts.get(ip)
+        if host is None:
+            host = self.hosts[ip] = {"mac": None, "first_seen": ts, "last_seen": ts, "open": set(), "closed": set()}
+        else:
+            host["last_seen"] = ts
+        return host
+
+    def feed(self, ts, frame, linktype):
+        self.counters["packets"] += 1
+        if linktype == LINKTYPE_ETHERNET:
+            if len(frame) < 14:
+                return
+            ethertype = (frame[12] << 8) | frame[13]
+            offset = 14
+            if ethertype == ETH_P_8021Q and len(frame) >= 18:
+                ethertype = (frame[16] << 8) | frame[17]
+                offset = 18
+        elif linktype == LINKTYPE_LINUX_SLL:
+            if len(frame) < 16:
+                return
+            ethertype = (frame[14] << 8) | frame[15]
+            offset = 16
+        elif linktype == LINKTYPE_RAW:
+            ethertype = packet.ETH_P_IP
+            offset = 0
+        else:
+            self.counters["unsupported"] += 1
+            return
+        if ethertype == packet.ETH_P_IP:
+            self.ipv4(ts, frame, offset)
+        elif ethertype == packet.ETH_P_ARP:
+            self.arp(ts, frame, offset)
+
+    def ipv4(self, ts, frame, offset):
+        if len(frame) < offset + 20 or frame[offset + 9] != socket.IPPROTO_TCP:
+            return
+        tcp = offset + (frame[offset] & 0x0f) * 4
+        if len(frame) < tcp + 14:
+            return
+        src, _ = self.IP_ADDRS.unpack_from(frame, offset + 12)
+        sport, _ = self.PORTS.unpack_from(frame, tcp)
+        flags = frame[tcp + 13]
+        if flags & TCP_RST:
+            self.counters["rst"] += 1
+            if flags & TCP_ACK:
+                # 对SYN的拒绝是RST-ACK；扫描机对SYN-ACK回的RST不带ACK，源地址是扫描机自己
+                self.host(src, ts)["closed"].add(sport)
+        elif flags & TCP_SYN:
+            if flags & TCP_ACK:
+                self.counters["syn_ack"] += 1
+                self.host(src, ts)["open"].add(sport)
+            else:
+                self.counters["syn"] += 1
+
+    def arp(self, ts, frame, offset):
+        if len(frame) < offset + 28:
+            return
+        operation = (frame[offset + 6] << 8) | frame[offset + 7]
+        self.counters["arp_reply" if operation == packet.ARP_REPLY else "arp_request"] += 1
+        sender = struct.unpack_from("!I", frame, offset + 14)[0]
+        if sender:  # 0.0.0.0 是地址冲突检测的探测报文
+            self.host(sender, ts)["mac"] = packet.mac_to_str(frame[offset + 8:offset + 14])
+
+    def analyze(self, path):
+        with PcapReader(path) as reader:
+            for ts, frame in reader:
+                self.feed(ts, frame, reader.linktype)
+
+    def to_dict(self):
+        return {
+            "counters": self.counters,
+            "hosts": [
+                {
+                    "ip": socket.inet_ntoa(struct.pack("!I", ip)),
+                    "mac": host["mac"],
+                    "open_ports": sorted(host["open"]),
+                    "closed_ports": sorted(host["closed"] - host["open"]),
+                    "first_seen": datetime.fromtimestamp(host["first_seen"]).isoformat(timespec="seconds"),
+                    "last_seen": datetime.fromtimestamp(host["last_seen"]).isoformat(timespec="seconds"),
+                }
+                for ip, host in sorted(self.hosts.items())
+            ],
+        }
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="离线分析扫描抓包，重建开放端口表和主机表")
+    parser.add_argument("files", nargs="+", help="pcap文件，多个文件的结果合并")
+    parser.add_argument("-o", "--output", help="把结果写成JSON文件")
+    parser.add_argument("--quiet", action="store_true", help="不打印主机表，只输出汇总")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    analyzer = CaptureAnalyzer()
+    start = time.monotonic()
+    for path in args.files:
+        try:
+            analyzer.analyze(path)
+        except (OSError, ValueError) as e:
+            print(f"跳过 {path}: {e}", file=sys.stderr)
+    elapsed = time.monotonic() - start
+    result = analyzer.to_dict()
+    if not args.quiet:
+        print(f"{'IP':<15} | {'MAC':<17} | 开放端口")
+        print("-" * 60)
+        for host in result["hosts"]:
+            print(f"{host['ip']:<15} | {host['mac'] or '-':<17} | {','.join(map(str, host['open_ports']))}")
+    counters = result["counters"]
+    print(f"分析{counters['packets']}个报文，用时{elapsed:.2f}秒 ({counters['packets'] / max(elapsed, 1e-9):,.0f} 报文/s): "
+          f"SYN {counters['syn']} SYN-ACK {counters['syn_ack']} RST {counters['rst']} "
+          f"ARP请求 {counters['arp_request']} ARP应答 {counters['arp_reply']}，主机{len(result['hosts'])}台")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+        print(f"结果已保存到: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,165 @@
-from scapy.all import *
+"""无状态SYN扫描（masscan风格）
 
-# 半开放扫描（SYN扫描）
-ans, unans = sr(IP(dst="127.0.0.1")/TCP(dport=(1,1024), flags="S"), timeout=2)
+一个原始套接字按预先构造好的报文模板发送SYN，每个报文只改写目的IP、目的端口、序列号和TCP校验和；
+序列号是(目的IP, 目的端口)的带密钥哈希（cookie），接收线程据此直接识别SYN-ACK，发送端不保存任何连接状态。
+收到SYN-ACK后内核发现本地没有对应的连接，会自动回RST，不会留下半开连接。
 
-# 分析开放端口
-for snd, rcv in ans:
-    if rcv[TCP].flags == "SA":  # SYN-ACK响应
-        print(f"Port {snd[TCP].dport} is open")
\ No newline at end of file
+需要root权限（原始套接字）。回环测试:
+    sudo python tcp.py 127.0.0.1 -p 1-65535 --rate 100000
+"""
+import os
+import sys
+import time
+import socket
+import struct
+import hashlib
+import argparse
+import ipaddress
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from packet import TcpSynTemplate, TCP_SYN, send_packet, pace
+
+TCP_RST = 0x04
+TCP_ACK = 0x10
+
+def parse_ports(spec):
+    """解析端口范围，如 "1-1024,3389,8080" """
+    ports = []
+    for part in spec.split(","):
+        if "-" in part:
+            start, end = part.split("-")
+            ports.extend(range(int(start), int(end) + 1))
+        elif part:
+            ports.append(int(part))
+    return list(dict.fromkeys(ports))
+
+def parse_targets(targets):
+    """把CIDR或IP字符串转换为整数地址区间（range）列表
+    不展开成地址列表，/8这样的大网段也只占常数内存；range可以反复迭代，发送时每个端口都从头遍历一遍
+    """
+    hosts = []
+    for target in targets:
+        network = ipaddress.ip_network(target, strict=False)
+        first = int(network.network_address)
+        addresses = range(first, first + network.num_addresses)
+        if network.num_addresses > 2:
+            addresses = addresses[1:-1]  # 跳过网络地址和广播地址
+        hosts.append(addresses)
+    return hosts
+
+def source_ip_for(dst):
+    """内核路由选择的源地址（UDP connect不发送任何数据）"""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.connect((dst, 9))
+        return s.getsockname()[0]
+
+class SynScanner:
+    """无状态SYN扫描器
+    Args:
+        source_ip: 源地址
+        source_port: 源端口，所有探测共用，接收时用它过滤无关报文
+        rate: 发送速率上限（每秒报文数）
+        wait: 发送结束后继续等待响应的时间（秒）
+    """
+    IP_ADDR = struct.Struct("!I")
+
+    def __init__(self, source_ip, source_port=None, rate=10000, wait=1.0):
+        self.source_ip = source_ip
+        self.source_port = source_port or 40000 + int.from_bytes(os.urandom(2), "big") % 20000
+        self.rate = rate
+        self.wait = wait
+        self.secret = os.urandom(16)
+        self.template = TcpSynTemplate(source_ip, self.source_port)
+        self.open = []
+        self.closed = 0
+        self.seen = set()
+        self.sent = 0
+        self.running = False
+
+    def cookie(self, ip, port):
+        digest = hashlib.blake2b(self.IP_ADDR.pack(ip) + port.to_bytes(2, "big"), key=self.secret, digest_size=4)
+        return int.from_bytes(digest.digest(), "big")
+
+    def send(self, hosts, ports):
+        """端口在外层、主机在内层，连续的报文分散到不同主机上
+        hosts为parse_targets返回的整数地址区间列表，字符串地址只在发送时生成
+        """
+        sender = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_RAW)
+        start = time.monotonic()
+        try:
+            for port in ports:
+                for addresses in hosts:
+                    for ip in addresses:
+                        address = socket.inet_ntoa(self.IP_ADDR.pack(ip))
+                        send_packet(sender, self.template.patch(ip, port, self.cookie(ip, port)), (address, 0))
+                        self.sent += 1
+                        pace(start, self.sent, self.rate)
+        finally:
+            sender.close()
+
+    def receive(self, receiver):
+        """接收线程：只处理发往本扫描源端口的报文，用cookie确认是自己发出的探测的响应"""
+        while self.running:
+            try:
+                data = receiver.recv(65535)
+            except socket.timeout:
+                continue
+            ihl = (data[0] & 0x0f) * 4
+            if len(data) < ihl + 20:
+                continue
+            sport, dport, _, ack = struct.unpack_from("!HHII", data, ihl)
+            flags = data[ihl + 13]
+            if dport != self.source_port or not flags & TCP_ACK:
+                continue
+            ip = self.IP_ADDR.unpack_from(data, 12)[0]
+            if (ack - 1) & 0xffffffff != self.cookie(ip, sport) or (ip, sport) in self.seen:
+                continue
+            self.seen.add((ip, sport))
+            if flags & TCP_SYN:
+                self.open.append((socket.inet_ntoa(data[12:16]), sport))
+                print(f"{socket.inet_ntoa(data[12:16])}:{sport} is open", flush=True)
+            elif flags & TCP_RST:
+                self.closed += 1
+
+    def run(self, hosts, ports):
+        receiver = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_TCP)
+        receiver.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8 * 1024 * 1024)
+        receiver.settimeout(0.1)
+        self.running = True
+        thread = threading.Thread(target=self.receive, args=(receiver,), name="syn-receiver", daemon=True)
+        thread.start()
+        start = time.monotonic()
+        try:
+            self.send(hosts, ports)
+            send_time = time.monotonic() - start
+            time.sleep(self.wait)
+        finally:
+            self.running = False
+            thread.join()
+            receiver.close()
+        return send_time
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="无状态SYN端口扫描（需要root权限）")
+    parser.add_argument("targets", nargs="*", default=["127.0.0.1"], help="要扫描的CIDR或IP，默认127.0.0.1")
+    parser.add_argument("-p", "--ports", default="1-1024", help="端口范围，如 1-1024,3389")
+    parser.add_argument("-r", "--rate", type=float, default=10000, help="发送速率上限（每秒报文数），0表示不限速")
+    parser.add_argument("-w", "--wait", type=float, default=1.0, help="发送结束后等待响应的时间（秒）")
+    parser.add_argument("--source-ip", help="源地址，默认由路由表决定")
+    parser.add_argument("--source-port", type=int, help="源端口，默认随机")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    hosts = parse_targets(args.targets)
+    ports = parse_ports(args.ports)
+    scanner = SynScanner(args.source_ip or source_ip_for(str(ipaddress.ip_address(hosts[0][0]))), args.source_port, args.rate, args.wait)
+    send_time = scanner.run(hosts, ports)
+    print(f"发送{scanner.sent}个SYN，用时{send_time:.3f}秒 ({scanner.sent / max(send_time, 1e-9):.0f} pps)，"
+          f"开放{len(scanner.open)}个，关闭{scanner.closed}个，"
+          f"无响应{scanner.sent - len(scanner.open) - scanner.closed}个")
+
+
+if __name__ == "__main__":
+    main()